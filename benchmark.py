@@ -0,0 +1,213 @@
+"""Benchmark for the simulation
+
+Build a random scenario in memory, run it, and report how many events the
+simulation did per second. With --no-monitor, no activities are recorded.
+With --memory, build and run it a second time under tracemalloc and report
+the peak memory allocated. With --batch, run it in timestamp order with the
+greedy Dispatcher and with a BatchDispatcher, and report the events done
+and riders served per second, and the rider wait time, of each. With
+--roads, drivers travel along the roads of a road graph, read from an
+edge-list file. With --cache, drivers share a CachedOracle, warmed up with
+every ride of the scenario, and its hits and misses are reported.
+
+For example:
+    python benchmark.py --riders 1000000 --drivers 5000 --memory
+    python benchmark.py --riders 100000 --rate 1000 --batch 1
+    python benchmark.py --riders 100000 --size 50 --cache 100000
+    python benchmark.py --riders 100000 --size 100 --roads roads.txt
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+from operator import attrgetter
+from typing import Dict, Iterator, List, Optional, Tuple
+from container import PriorityQueue
+from dispatcher import BatchDispatcher, Dispatcher
+from driver import Driver
+from event import BatchDispatch, Event, DriverRequest, RiderRequest
+from location import intern_location
+from rider import Rider, SATISFIED
+from simulation import Simulation
+from road import RoadOracle, read_graph
+from travel import CachedOracle, TravelOracle
+
+
+class _CountingQueue(PriorityQueue):
+    """A PriorityQueue of events that counts the events removed from it,
+    other than BatchDispatch events.
+
+    A BatchDispatch event only ticks the batch dispatcher, which the greedy
+    dispatcher needs no events for, so it is not counted, to keep the
+    counts of the two comparable.
+
+    === Attributes ===
+    removed: The number of events removed so far, other than BatchDispatch
+        events.
+    """
+
+    removed: int
+
+    def __init__(self) -> None:
+        """Initialize an empty _CountingQueue.
+
+        """
+        super().__init__(key=attrgetter('timestamp'))
+        self.removed = 0
+
+    def remove(self) -> object:
+        """Remove and return the next event, and count it unless it is a
+        BatchDispatch event.
+
+        """
+        event = super().remove()
+        if not isinstance(event, BatchDispatch):
+            self.removed += 1
+        return event
+
+
+def make_events(riders: int, drivers: int, size: int, seed: int,
+                rate: int = 1) -> List[Event]:
+    """Return the events of a random scenario, in timestamp order.
+
+    The drivers all start at time 0, and the riders request rides at random
+    times, <rate> per time unit on average, on a <size> by <size> grid.
+    """
+    generator = random.Random(seed)
+
+    def place() -> object:
+        return intern_location(generator.randint(1, size),
+                               generator.randint(1, size))
+
+    events = [DriverRequest(0, Driver("D{}".format(i), place(),
+                                      generator.randint(1, 3)))
+              for i in range(drivers)]
+    span = max(1, riders // rate)
+    times = sorted(generator.randrange(span) for _ in range(riders))
+    for i, timestamp in enumerate(times):
+        rider = Rider("R{}".format(i), generator.randint(1, 20), place(),
+                      place())
+        events.append(RiderRequest(timestamp, rider))
+    return events
+
+
+def rides(events: List[Event]) -> Iterator[Tuple[object, object, int]]:
+    """Yield the (origin, destination, speed) trip of every ride requested
+    in <events>, at the speed of every driver in them.
+
+    """
+    speeds = {event.driver.speed for event in events
+              if isinstance(event, DriverRequest)}
+    for event in events:
+        if isinstance(event, RiderRequest):
+            for speed in speeds:
+                yield event.rider.origin, event.rider.destination, speed
+
+
+def riders_served(events: List[Event]) -> int:
+    """Return the number of riders requested in <events> that have been
+    picked up.
+
+    """
+    return sum(1 for event in events if isinstance(event, RiderRequest)
+               and event.rider.status == SATISFIED)
+
+
+def run(events: List[Event], instrument: bool = True,
+        dispatcher: Optional[Dispatcher] = None,
+        merge_initial: bool = False,
+        oracle: Optional[TravelOracle] = None) \
+        -> Tuple[int, float, Dict[str, float]]:
+    """Run a simulation of <events>, and return the number of events done,
+    the time it took, in seconds, and the report.
+
+    The events done are the initial events and the events they spawn,
+    other than BatchDispatch events, so the count does not depend on the
+    dispatcher or on <merge_initial>. If <instrument> is False, no monitor
+    records the activities, and the report is empty. dispatcher,
+    merge_initial and oracle are as for Simulation.
+    """
+    queue = _CountingQueue()
+    simulation = Simulation(events=queue, merge_initial=merge_initial,
+                            dispatcher=dispatcher, instrument=instrument,
+                            oracle=oracle)
+    start = time.perf_counter()
+    report = simulation.run(events)
+    seconds = time.perf_counter() - start
+    # Initial events merged into the run are done without being queued.
+    done = queue.removed + (len(events) if merge_initial else 0)
+    return done, seconds, report
+
+
+def main() -> None:
+    """Run the benchmark with the options given on the command line.
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--riders', type=int, default=1000000)
+    parser.add_argument('--drivers', type=int, default=5000)
+    parser.add_argument('--size', type=int, default=1000,
+                        help="the number of rows and columns in the grid")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--rate', type=int, default=1,
+                        help="the number of ride requests per time unit")
+    parser.add_argument('--memory', action='store_true',
+                        help="also measure peak memory with tracemalloc")
+    parser.add_argument('--no-monitor', action='store_true',
+                        help="run without recording any activities")
+    parser.add_argument('--batch', type=int, metavar='WINDOW',
+                        help="compare greedy and batch dispatch, with "
+                             "batches every WINDOW time units")
+    parser.add_argument('--roads', metavar='FILE',
+                        help="travel along the roads in the edge-list FILE")
+    parser.add_argument('--cache', type=int, metavar='SIZE',
+                        help="remember up to SIZE travel times")
+    args = parser.parse_args()
+    instrument = not args.no_monitor
+    oracle = None
+    if args.roads is not None:
+        oracle = RoadOracle(read_graph(args.roads))
+    if args.cache is not None:
+        oracle = CachedOracle(Driver.oracle if oracle is None else oracle,
+                              args.cache)
+        oracle.warm(rides(make_events(args.riders, args.drivers, args.size,
+                                      args.seed, args.rate)))
+
+    if args.batch is not None:
+        for name, dispatcher in (("greedy", Dispatcher()),
+                                 ("batch", BatchDispatcher(args.batch))):
+            events = make_events(args.riders, args.drivers, args.size,
+                                 args.seed, args.rate)
+            done, seconds, report = run(events, instrument, dispatcher, True,
+                                        oracle)
+            served = riders_served(events)
+            print("{}: {} events and {} riders served in {:.2f} s: "
+                  "{:.0f} events/s, {:.0f} riders/s, rider wait time {}"
+                  .format(name, done, served, seconds, done / seconds,
+                          served / seconds, report.get("rider_wait_time")))
+        return
+
+    done, seconds, _ = run(make_events(args.riders, args.drivers, args.size,
+                                       args.seed, args.rate), instrument,
+                           oracle=oracle)
+    print("{} events in {:.2f} s: {:.0f} events/s".format(
+        done, seconds, done / seconds))
+
+    if args.memory:
+        tracemalloc.start()
+        done, _, _ = run(make_events(args.riders, args.drivers, args.size,
+                                     args.seed, args.rate), instrument,
+                         oracle=oracle)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("peak memory: {:.1f} MiB ({:.0f} B/event)".format(
+            peak / 2 ** 20, peak / done))
+
+    if args.cache is not None:
+        print("travel-time cache: {} hits, {} misses".format(
+            oracle.hits, oracle.misses))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Activity bus for the simulation
+
+The simulation publishes every activity to an ActivityBus, which passes it
+on to the sinks that have subscribed to its category and description. A
+sink is any function with the signature of Monitor.notify, such as the
+notify method of a Monitor, an exporter or a profiler.
+
+=== Constants ===
+CATEGORIES: The categories of activities.
+DESCRIPTIONS: The descriptions of activities.
+"""
+
+from typing import Callable, Dict, Iterable, List, Optional
+from location import Location
+from monitor import RIDER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF
+
+Sink = Callable[[int, str, str, str, Location], None]
+
+CATEGORIES = (RIDER, DRIVER)
+DESCRIPTIONS = (REQUEST, CANCEL, PICKUP, DROPOFF)
+
+
+class ActivityBus:
+    """A bus that passes the activities published to it on to the sinks
+    subscribed to them.
+
+    An ActivityBus can be used wherever a monitor is notified of
+    activities: publishing an activity is calling notify(). Publishing an
+    activity that no sink is subscribed to costs one call and two
+    dictionary lookups. With no sinks at all, notify() does nothing, and
+    with a single sink subscribed to every activity, notify() is that sink.
+
+    >>> bus = ActivityBus()
+    >>> pickups = []
+    >>> bus.subscribe(lambda *activity: pickups.append(activity[3]),
+    ...               descriptions=[PICKUP])
+    >>> bus.notify(0, RIDER, REQUEST, 'Rita', Location(1, 1))
+    >>> bus.notify(2, RIDER, PICKUP, 'Rita', Location(1, 1))
+    >>> pickups
+    ['Rita']
+    """
+
+    # === Private Attributes ===
+    _sinks: Dict[str, Dict[str, List[Sink]]]
+    #     A dictionary whose key is a category, and value is another
+    #     dictionary. The key of the second dictionary is a description, and
+    #     its value is the sinks subscribed to activities with that category
+    #     and description, in the order subscribed.
+    #
+    # === Representation Invariants ===
+    # If there are no sinks, or one sink subscribed to every activity, this
+    # bus has an attribute notify that overrides the method notify.
+
+    def __init__(self) -> None:
+        """Initialize an ActivityBus with no sinks.
+
+        """
+        self._sinks = {category: {description: []
+                                  for description in DESCRIPTIONS}
+                       for category in CATEGORIES}
+        self._rebind()
+
+    def __len__(self) -> int:
+        """Return the number of distinct sinks subscribed to this bus.
+
+        """
+        return len(self._subscribed())
+
+    def subscribe(self, sink: Sink,
+                  categories: Optional[Iterable[str]] = None,
+                  descriptions: Optional[Iterable[str]] = None) -> None:
+        """Subscribe <sink> to the activities with one of <categories> and
+        one of <descriptions>.
+
+        By default, <sink> is subscribed to every category, or every
+        description. A sink already subscribed to an activity is not
+        subscribed to it again.
+        """
+        for category in CATEGORIES if categories is None else categories:
+            for description in (DESCRIPTIONS if descriptions is None
+                                else descriptions):
+                sinks = self._sinks[category][description]
+                if sink not in sinks:
+                    sinks.append(sink)
+        self._rebind()
+
+    def unsubscribe(self, sink: Sink) -> None:
+        """Unsubscribe <sink> from every activity.
+
+        """
+        for descriptions in self._sinks.values():
+            for sinks in descriptions.values():
+                if sink in sinks:
+                    sinks.remove(sink)
+        self._rebind()
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Publish the activity to the sinks subscribed to it.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or RIDER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROP_OFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        for sink in self._sinks[category][description]:
+            sink(timestamp, category, description, identifier, location)
+
+    def _rebind(self) -> None:
+        """Bind notify to the cheapest function that publishes activities
+        to the sinks subscribed now.
+
+        """
+        subscribed = self._subscribed()
+        self.__dict__.pop('notify', None)
+        if not subscribed:
+            self.notify = _discard
+        elif len(subscribed) == 1 and all(
+                sinks for descriptions in self._sinks.values()
+                for sinks in descriptions.values()):
+            self.notify = subscribed[0]
+
+    def _subscribed(self) -> List[Sink]:
+        """Return the distinct sinks subscribed to this bus.
+
+        """
+        # Sinks are compared by equality, not identity, since each access to
+        # a method such as monitor.notify makes a new, equal, bound method.
+        subscribed = []
+        for descriptions in self._sinks.values():
+            for sinks in descriptions.values():
+                for sink in sinks:
+                    if sink not in subscribed:
+                        subscribed.append(sink)
+        return subscribed
+
+
+def _discard(timestamp: int, category: str, description: str,
+             identifier: str, location: Location) -> None:
+    """Do nothing with the activity.
+
+    """
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'max-args': 6,
+            'extra-imports': ['typing', 'location', 'monitor']})
@@ -1,5 +1,9 @@
 """Containers of objects"""
 
+from collections import deque
+from heapq import heapify, heappush, heappop
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
 
 class Container:
     """A container that holds objects.
@@ -19,12 +23,32 @@ class Container:
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def peek(self) -> object:
+        """Return the item that remove() would return, without removing it.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
     def is_empty(self) -> bool:
         """Return True iff this Container is empty.
 
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def __len__(self) -> int:
+        """Return the number of items in this Container.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def purge(self, predicate: Callable[[Any], bool]) -> int:
+        """Remove every item for which <predicate> returns True from this
+        Container, and return how many were removed.
+
+        The remaining items keep their order.
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
 
 class PriorityQueue(Container):
     """A queue of items that operates in priority order.
@@ -35,26 +59,52 @@ class PriorityQueue(Container):
     removed.
 
     Priority is defined by the rich comparison methods for the objects in the
-    container (__lt__, __le__, __gt__, __ge__).
+    container (__lt__, __le__, __gt__, __ge__), or, if a <key> function was
+    given, by the rich comparison methods of the keys it returns.
 
     If x < y, then x has a *HIGHER* priority than y.
 
     All objects in the container must be of the same type.
+
+    The queue is a binary heap, so both add and remove take O(log n) time.
     """
 
     # === Private Attributes ===
-    _items: list
-    #     The items stored in the priority queue.
+    _items: List[Tuple[Any, int, object]]
+    #     The entries of the priority queue, stored as a binary heap.
+    #     Each entry is a tuple (key, sequence number, item).
+    _key: Optional[Callable[[Any], Any]]
+    #     A function that computes the priority of an item, or None if
+    #     items are compared directly.
+    _count: int
+    #     The sequence number to give to the next item that is added.
     #
     # === Representation Invariants ===
-    # _items is a sorted list, where the first item in the queue is the
-    # item with the highest priority.
+    # _items satisfies the heap invariant: no entry is less than the entry
+    # at index (i - 1) // 2, for every index i > 0.
+    # The sequence numbers of the entries are distinct, so ties on the key
+    # never fall through to comparing the items themselves.
 
-    def __init__(self) -> None:
+    def __init__(self, key: Optional[Callable[[Any], Any]] = None) -> None:
         """Initialize an empty PriorityQueue.
 
+        key: A function that returns the priority of an item. It is called
+            once, when the item is added. If it is None, the items themselves
+            are compared.
         """
         self._items = []
+        self._key = key
+        self._count = 0
+
+    def __len__(self) -> int:
+        """Return the number of items in this PriorityQueue.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add("thing")
+        >>> len(pq)
+        1
+        """
+        return len(self._items)
 
     def remove(self) -> object:
         """Remove and return the next item from this PriorityQueue.
@@ -75,7 +125,22 @@ class PriorityQueue(Container):
         >>> pq.remove()
         'yellow'
         """
-        return self._items.pop(0)
+        return heappop(self._items)[2]
+
+    def peek(self) -> object:
+        """Return the next item from this PriorityQueue, without removing it.
+
+        Precondition: <self> should not be empty.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add("red")
+        >>> pq.add("blue")
+        >>> pq.peek()
+        'blue'
+        >>> len(pq)
+        2
+        """
+        return self._items[0][2]
 
     def is_empty(self) -> bool:
         """
@@ -98,19 +163,214 @@ class PriorityQueue(Container):
         >>> pq.add("blue")
         >>> pq.add("red")
         >>> pq.add("green")
-        >>> pq._items
+        >>> [pq.remove() for _ in range(4)]
         ['blue', 'green', 'red', 'yellow']
+
+        Items with the same priority are removed in FIFO order.
+
+        >>> pq = PriorityQueue(key=len)
+        >>> pq.add("yellow")
+        >>> pq.add("blue")
+        >>> pq.add("red")
+        >>> pq.add("green")
+        >>> [pq.remove() for _ in range(4)]
+        ['red', 'blue', 'green', 'yellow']
+        """
+        key = item if self._key is None else self._key(item)
+        heappush(self._items, (key, self._count, item))
+        self._count += 1
+
+    def purge(self, predicate: Callable[[Any], bool]) -> int:
+        """Remove every item for which <predicate> returns True from this
+        PriorityQueue, and return how many were removed.
+
+        This takes O(n) time. The remaining items keep their order.
+
+        >>> pq = PriorityQueue(key=len)
+        >>> for colour in ["red", "blue", "tan", "green"]:
+        ...     pq.add(colour)
+        >>> pq.purge(lambda colour: colour.startswith("r"))
+        1
+        >>> [pq.remove() for _ in range(3)]
+        ['tan', 'blue', 'green']
+        """
+        size = len(self._items)
+        self._items = [entry for entry in self._items
+                       if not predicate(entry[2])]
+        heapify(self._items)
+        return size - len(self._items)
+
+
+class BucketQueue(Container):
+    """A queue of items with integer priorities, stored in buckets.
+
+    This is a calendar queue: all of the items that share a priority are
+    kept together in one FIFO bucket, and only the distinct priorities are
+    kept in a heap. Adding an item whose priority already has a bucket
+    takes O(1) time, which makes it a good fit when many items share a
+    priority, as simulation events that share a timestamp do.
+
+    Items are removed in the same order as from a PriorityQueue: the item
+    with the smallest priority first, and ties in FIFO order. A whole
+    bucket of tied items can also be removed at once.
+
+    Priority is given by the integer that the <key> function returns for
+    an item, or by the item itself if there is no key function.
+    """
+
+    # === Private Attributes ===
+    _buckets: Dict[int, Deque[object]]
+    #     A dictionary whose key is a priority, and value is the items with
+    #     that priority in the order they were added.
+    _priorities: List[int]
+    #     The priorities that have a bucket, stored as a binary heap.
+    _key: Optional[Callable[[Any], int]]
+    #     A function that computes the priority of an item, or None if
+    #     items are their own priorities.
+    _size: int
+    #     The number of items in the queue.
+    #
+    # === Representation Invariants ===
+    # The elements of _priorities are exactly the keys of _buckets.
+    # No bucket in _buckets is empty.
+    # _size is the total length of the buckets in _buckets.
+
+    def __init__(self, key: Optional[Callable[[Any], int]] = None) -> None:
+        """Initialize an empty BucketQueue.
+
+        key: A function that returns the integer priority of an item. If it
+            is None, the items themselves are used as priorities.
+        """
+        self._buckets = {}
+        self._priorities = []
+        self._key = key
+        self._size = 0
+
+    def __len__(self) -> int:
+        """Return the number of items in this BucketQueue.
+
+        >>> bq = BucketQueue()
+        >>> bq.add(3)
+        >>> bq.add(3)
+        >>> len(bq)
+        2
+        """
+        return self._size
+
+    def add(self, item: object) -> None:
+        """Add <item> to this BucketQueue.
+
+        >>> bq = BucketQueue(key=len)
+        >>> bq.add("yellow")
+        >>> bq.add("blue")
+        >>> bq.add("red")
+        >>> bq.add("green")
+        >>> [bq.remove() for _ in range(4)]
+        ['red', 'blue', 'green', 'yellow']
+        """
+        priority = item if self._key is None else self._key(item)
+        bucket = self._buckets.get(priority)
+        if bucket is None:
+            bucket = self._buckets[priority] = deque()
+            heappush(self._priorities, priority)
+        bucket.append(item)
+        self._size += 1
+
+    def remove(self) -> object:
+        """Remove and return the next item from this BucketQueue.
+
+        Precondition: <self> should not be empty.
+
+        >>> bq = BucketQueue()
+        >>> bq.add(5)
+        >>> bq.add(2)
+        >>> bq.remove()
+        2
+        """
+        priority = self._priorities[0]
+        bucket = self._buckets[priority]
+        item = bucket.popleft()
+        if not bucket:
+            del self._buckets[priority]
+            heappop(self._priorities)
+        self._size -= 1
+        return item
+
+    def peek(self) -> object:
+        """Return the next item from this BucketQueue, without removing it.
+
+        Precondition: <self> should not be empty.
+
+        >>> bq = BucketQueue()
+        >>> bq.add(5)
+        >>> bq.add(2)
+        >>> bq.peek()
+        2
         """
+        return self._buckets[self._priorities[0]][0]
 
-        if not self._items:
-            self._items.append(item)
-        else:
-            i = 0
-            while i < len(self._items) and item.__gt__(self._items[i]):
-                i += 1
-            self._items.insert(i, item)
+    def remove_bucket(self) -> List[object]:
+        """Remove and return all of the items with the highest priority, in
+        the order they were added.
+
+        Items with that priority that are added afterwards go into a new
+        bucket, so they are returned by the next call.
+
+        Precondition: <self> should not be empty.
+
+        >>> bq = BucketQueue(key=len)
+        >>> bq.add("red")
+        >>> bq.add("yellow")
+        >>> bq.add("tan")
+        >>> bq.remove_bucket()
+        ['red', 'tan']
+        >>> bq.remove_bucket()
+        ['yellow']
+        """
+        bucket = self._buckets.pop(heappop(self._priorities))
+        self._size -= len(bucket)
+        return list(bucket)
+
+    def purge(self, predicate: Callable[[Any], bool]) -> int:
+        """Remove every item for which <predicate> returns True from this
+        BucketQueue, and return how many were removed.
+
+        This takes O(n) time. The remaining items keep their order.
+
+        >>> bq = BucketQueue(key=len)
+        >>> for colour in ["red", "blue", "tan", "green"]:
+        ...     bq.add(colour)
+        >>> bq.purge(lambda colour: colour.startswith("r"))
+        1
+        >>> [bq.remove() for _ in range(3)]
+        ['tan', 'blue', 'green']
+        """
+        size = self._size
+        for priority, bucket in list(self._buckets.items()):
+            kept = deque(item for item in bucket if not predicate(item))
+            self._size -= len(bucket) - len(kept)
+            if kept:
+                self._buckets[priority] = kept
+            else:
+                del self._buckets[priority]
+        self._priorities = list(self._buckets)
+        heapify(self._priorities)
+        return size - self._size
+
+    def is_empty(self) -> bool:
+        """Return true iff this BucketQueue is empty.
+
+        >>> bq = BucketQueue()
+        >>> bq.is_empty()
+        True
+        >>> bq.add(1)
+        >>> bq.is_empty()
+        False
+        """
+        return not self._priorities
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all()
+    python_ta.check_all(
+        config={'extra-imports': ['collections', 'heapq', 'typing']})
@@ -1,8 +1,33 @@
-"""Dispatcher for the simulation"""
+"""Dispatcher for the simulation
 
-from typing import Optional
-from driver import Driver
-from rider import Rider
+=== Constants ===
+FIFO: A constant for the policy of giving a driver the rider that has been
+    waiting the longest.
+NEAREST: A constant for the policy of giving a driver the waiting rider
+    that it can reach soonest.
+DENSE_LIMIT: The largest number of available drivers for which a
+    BatchDispatcher finds candidates from the drive times of every driver
+    to every rider, rather than by searching the grid.
+KERNEL_SIZE: The largest number of drive times a BatchDispatcher computes
+    at once when finding candidates with numpy.
+"""
+
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+from driver import Driver, drive_times
+from matching import UNMATCHABLE, min_cost_matching
+from rider import Rider, WAITING
+from spatial import GridIndex
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FIFO = "fifo"
+NEAREST = "nearest"
+DENSE_LIMIT = 2048
+KERNEL_SIZE = 1 << 20
 
 
 class Dispatcher:
@@ -19,17 +44,92 @@ class Dispatcher:
     the dispatcher does nothing. Once a driver requests a rider, the driver
     is registered with the dispatcher, and will be used to fulfill future
     rider requests.
+
+    Which waiting rider a driver is given depends on the rider policy:
+    FIFO gives the rider that has been waiting the longest, and NEAREST
+    gives the rider that the driver can reach soonest.
+
+    === Attributes ===
+    available_d: The drivers that are available for rider requests, by id,
+        in the order in which they became available.
+    waiting_r: The riders that are waiting for a driver, by id.
     """
 
-    available_d: list
-    waiting_r: list
+    available_d: Dict[str, Driver]
+    waiting_r: Dict[str, Rider]
+
+    # === Private Attributes ===
+    _drivers: GridIndex
+    #     The available drivers, indexed by location. Each driver is stored
+    #     under its id, as a tuple (rank, driver), where rank is its position
+    #     in the order in which the drivers became available.
+    _rank: int
+    #     The rank to give the next driver that becomes available, or rider
+    #     that starts waiting.
+    _speeds: Dict[int, int]
+    #     A dictionary whose key is a speed, and value is the number of
+    #     available drivers with that speed.
+    _rider_policy: str
+    #     The policy (FIFO or NEAREST) for choosing a waiting rider.
+    _riders: GridIndex
+    #     The waiting riders, indexed by origin, under the NEAREST policy.
+    #     Each rider is stored under its id, as a tuple (rank, rider), where
+    #     rank is its position in the order in which the riders started
+    #     waiting.
+    _queue: Deque[Rider]
+    #     The waiting list under the FIFO policy, in the order in which the
+    #     riders were added. A rider is added each time they are put on the
+    #     waiting list, and removed lazily when they leave it.
+    _copies: Dict[str, int]
+    #     A dictionary whose key is the id of a rider in _queue, and value is
+    #     the number of times the rider is still waiting in _queue.
+    _cancelled: Dict[str, int]
+    #     A dictionary whose key is the id of a rider in _queue, and value is
+    #     the number of times the rider has left the waiting list without
+    #     their entry in _queue being removed yet.
+    _stale: int
+    #     The number of entries in _queue that their riders have left.
+    #
+    # === Representation Invariants ===
+    # _drivers holds exactly the drivers in available_d, and ranks them in
+    # the same order.
+    # Under the NEAREST policy, _riders holds exactly the riders in
+    # waiting_r, and ranks them in the same order. Otherwise, it is empty.
+    # Under the FIFO policy, a rider is in waiting_r iff _copies has their
+    # id. The first _cancelled[id] entries for a rider in _queue are the
+    # ones they have left, and _stale is the sum of the values of
+    # _cancelled. Under the NEAREST policy, _queue is empty.
 
-    def __init__(self) -> None:
+    def __init__(self, cell_size: int = 16, rider_policy: str = FIFO) -> None:
         """Initialize a Dispatcher.
 
+        cell_size: The number of rows (and columns) covered by each cell of
+            the grids that available drivers and waiting riders are indexed
+            by.
+        rider_policy: The policy (FIFO or NEAREST) for choosing which waiting
+            rider to give a driver.
+
+        Raise a ValueError if rider_policy is neither FIFO nor NEAREST.
+
+        >>> Dispatcher(rider_policy="closest")
+        Traceback (most recent call last):
+        ...
+        ValueError: unknown rider policy: 'closest'
         """
-        self.available_d = []
-        self.waiting_r = []
+        if rider_policy not in (FIFO, NEAREST):
+            raise ValueError("unknown rider policy: {!r}".format(
+                rider_policy))
+        self.available_d = {}
+        self.waiting_r = {}
+        self._drivers = GridIndex(cell_size)
+        self._rank = 0
+        self._speeds = {}
+        self._rider_policy = rider_policy
+        self._riders = GridIndex(cell_size)
+        self._queue = deque()
+        self._copies = {}
+        self._cancelled = {}
+        self._stale = 0
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -46,19 +146,18 @@ class Dispatcher:
         """
 
         if not self.available_d:
-            self.waiting_r.append(rider)
+            self._add_waiting(rider)
             return None
-        if len(self.available_d) == 1:
-            self.available_d[0].is_idle = False
-            return self.available_d[0]
-
-        i = 0
-        nearest = self.available_d[0]
-        while i < len(self.available_d):
-            if nearest.start_drive(rider.origin) > \
-               (self.available_d[i].start_drive(rider.origin)):
-                nearest = self.available_d[i]
-            i += 1
+
+        # Choose the driver with the shortest drive to the rider, and among
+        # those, the one that became available first. No driver can reach
+        # the rider from a given distance sooner than the fastest one could.
+        origin = rider.origin
+        fastest = max(self._speeds)
+        _, nearest = self._drivers.nearest(
+            origin,
+            lambda entry: (entry[1].get_drive_time(origin), entry[0]),
+            lambda distance: (round(round(distance / fastest) / fastest), -1))
         nearest.is_idle = False
         return nearest
 
@@ -69,22 +168,431 @@ class Dispatcher:
 
         """
 
-        if driver not in self.available_d:
-            self.available_d.append(driver)
+        if not self.is_available(driver):
+            self.mark_available(driver)
         elif len(self.waiting_r) > 0:
             driver.is_idle = False
-            nearest = self.waiting_r.pop(0)
-            return nearest
+            return self._remove_waiting(driver)
         return None
 
+    def is_available(self, driver: Driver) -> bool:
+        """Return True iff the driver is available for rider requests.
+
+        """
+        return driver.id in self.available_d
+
+    def mark_available(self, driver: Driver) -> None:
+        """Make the driver available for rider requests, at its current
+        location, if it is not already.
+
+        """
+        if driver.id in self.available_d:
+            return
+        self.available_d[driver.id] = driver
+        self._drivers.add(driver.id, driver.location, (self._rank, driver))
+        self._rank += 1
+        self._speeds[driver.speed] = self._speeds.get(driver.speed, 0) + 1
+
+    def mark_busy(self, driver: Driver) -> None:
+        """Stop using the driver for rider requests, if it is available.
+
+        """
+        if driver.id not in self.available_d:
+            return
+        del self.available_d[driver.id]
+        self._drivers.remove(driver.id)
+        self._speeds[driver.speed] -= 1
+        if not self._speeds[driver.speed]:
+            del self._speeds[driver.speed]
+
     def cancel_ride(self, rider: Rider) -> None:
         """Cancel the ride for rider.
 
         """
-        if rider in self.waiting_r:
-            self.waiting_r.remove(rider)
+        if rider.id not in self.waiting_r:
+            return
+        if self._rider_policy == NEAREST:
+            del self.waiting_r[rider.id]
+            self._riders.remove(rider.id)
+        else:
+            self._release(rider)
+            self._cancelled[rider.id] = self._cancelled.get(rider.id, 0) + 1
+            self._stale += 1
+            if 2 * self._stale > len(self._queue):
+                self._compact_queue()
+
+    def batch_due(self, timestamp: int) -> Optional[int]:
+        """Return the time at which to match waiting riders to available
+        drivers in a batch, if a batch should now be scheduled, or None.
+
+        A Dispatcher matches each request as it is made, so it never needs
+        a batch.
+        """
+        return None
+
+    def match(self) -> List[Tuple[Driver, Rider]]:
+        """Match waiting riders to available drivers in a batch, and return
+        the (driver, rider) pairs matched.
+
+        A Dispatcher matches each request as it is made, so a batch
+        matches no one.
+        """
+        return []
+
+    def _add_waiting(self, rider: Rider) -> None:
+        """Add the rider to the waiting list.
+
+        Under the FIFO policy, a rider that is already waiting is added
+        again, and waits in both places.
+        """
+        if self._rider_policy == NEAREST:
+            if rider.id in self.waiting_r:
+                return
+            self._riders.add(rider.id, rider.origin, (self._rank, rider))
+            self._rank += 1
+        else:
+            self._queue.append(rider)
+            self._copies[rider.id] = self._copies.get(rider.id, 0) + 1
+        self.waiting_r[rider.id] = rider
+
+    def _release(self, rider: Rider) -> None:
+        """Record that one of the rider's entries in the FIFO waiting list
+        has left it.
+
+        """
+        copies = self._copies[rider.id] - 1
+        if copies:
+            self._copies[rider.id] = copies
+        else:
+            del self._copies[rider.id]
+            del self.waiting_r[rider.id]
+
+    def _compact_queue(self) -> None:
+        """Remove the entries that their riders have left from the FIFO
+        waiting list, so that it holds no references to riders that are no
+        longer waiting.
+
+        """
+        queue = deque()
+        for rider in self._queue:
+            cancelled = self._cancelled.get(rider.id)
+            if not cancelled:
+                queue.append(rider)
+            elif cancelled > 1:
+                self._cancelled[rider.id] = cancelled - 1
+            else:
+                del self._cancelled[rider.id]
+        self._queue = queue
+        self._stale = 0
+
+    def _remove_waiting(self, driver: Driver) -> Rider:
+        """Remove and return the waiting rider to give the driver, according
+        to the rider policy.
+
+        Precondition: the waiting list is not empty.
+        """
+        if self._rider_policy != NEAREST:
+            while True:
+                rider = self._queue.popleft()
+                cancelled = self._cancelled.get(rider.id)
+                if not cancelled:
+                    self._release(rider)
+                    return rider
+                # This entry is one the rider has already left.
+                self._stale -= 1
+                if cancelled > 1:
+                    self._cancelled[rider.id] = cancelled - 1
+                else:
+                    del self._cancelled[rider.id]
+
+        # Choose the rider the driver can reach soonest, and among those,
+        # the one that has been waiting the longest. A rider at a given
+        # distance cannot be reached any sooner than the driver's speed
+        # allows.
+        speed = driver.speed
+        _, rider = self._riders.nearest(
+            driver.location,
+            lambda entry: (driver.get_drive_time(entry[1].origin), entry[0]),
+            lambda distance: (round(round(distance / speed) / speed), -1))
+        self._riders.remove(rider.id)
+        del self.waiting_r[rider.id]
+        return rider
+
+
+class BatchDispatcher(Dispatcher):
+    """A dispatcher that matches riders to drivers in batches.
+
+    Ride requests are not matched as they are made. Instead, riders wait,
+    and drivers stay available, until the next batch, at the end of the
+    window of <window> time units in which they arrived. A batch matches
+    as many waiting riders to available drivers as it can, with the least
+    total time for the drivers to reach their riders. To keep batches
+    small, each rider is only considered for the <candidates> drivers that
+    could reach them soonest, and riders that share no candidates are
+    matched separately.
+
+    A matched driver stays available, so that the pickup happens as with a
+    Dispatcher, but is not given to anyone else, unless their rider is no
+    longer waiting by the next batch. A rider who is already waiting, or
+    matched, when a driver is requested for them again is handled as by a
+    Dispatcher, so cancellations work as before.
+
+    Batches are scheduled by the events, through batch_due(), so the
+    simulation must do its events in timestamp order, with
+    Simulation(merge_initial=True). A Simulation refuses a BatchDispatcher
+    otherwise.
+
+    === Attributes ===
+    window: The length of the window of time that each batch covers.
+    candidates: The number of drivers each rider may be matched to.
+    """
+
+    window: int
+    candidates: int
+
+    # === Private Attributes ===
+    _scheduled: bool
+    #     True iff a batch has been scheduled and has not yet been matched.
+    _riders_of: Dict[str, Rider]
+    #     A dictionary whose key is the id of a matched driver, and value is
+    #     the rider they were matched to.
+    _drivers_of: Dict[str, Driver]
+    #     A dictionary whose key is the id of a matched rider, and value is
+    #     the driver they were matched to.
+    #
+    # === Representation Invariants ===
+    # A matched driver is in available_d, but not in _drivers, and is not
+    # counted in _speeds.
+
+    def __init__(self, window: int = 1, candidates: int = 8,
+                 cell_size: int = 16, rider_policy: str = FIFO) -> None:
+        """Initialize a BatchDispatcher with batches every <window> time
+        units, and <candidates> drivers considered for each rider.
+
+        cell_size and rider_policy are as for Dispatcher.
+
+        Precondition: window > 0 and candidates > 0.
+        """
+        super().__init__(cell_size, rider_policy)
+        self.window = window
+        self.candidates = candidates
+        self._scheduled = False
+        self._riders_of = {}
+        self._drivers_of = {}
+
+    def request_driver(self, rider: Rider) -> Optional[Driver]:
+        """Add the rider to the waiting list for the next batch, and return
+        None.
+
+        If the rider is already waiting or matched, return a driver for
+        them, as a Dispatcher would, or None if no driver is free.
+        """
+        if rider.id in self.waiting_r or rider.id in self._drivers_of:
+            if not self._drivers:
+                return None
+            return super().request_driver(rider)
+        self._add_waiting(rider)
+        return None
+
+    def request_rider(self, driver: Driver) -> Optional[Rider]:
+        """Make the driver available for the next batch, and return None.
+
+        """
+        self.mark_available(driver)
+        return None
+
+    def mark_busy(self, driver: Driver) -> None:
+        """Stop using the driver for rider requests, if it is available.
+
+        """
+        rider = self._riders_of.pop(driver.id, None)
+        if rider is None:
+            super().mark_busy(driver)
+        else:
+            del self._drivers_of[rider.id]
+            del self.available_d[driver.id]
+
+    def batch_due(self, timestamp: int) -> Optional[int]:
+        """Return the end of the window that contains <timestamp>, if there
+        are riders waiting, drivers available and no batch scheduled, and
+        None otherwise.
+
+        """
+        if self._scheduled or not self.waiting_r or not self._drivers:
+            return None
+        self._scheduled = True
+        return (timestamp // self.window + 1) * self.window
+
+    def match(self) -> List[Tuple[Driver, Rider]]:
+        """Match waiting riders to available drivers in a batch, and return
+        the (driver, rider) pairs matched, in the order in which the riders
+        started waiting.
+
+        >>> from location import Location
+        >>> dispatcher = BatchDispatcher()
+        >>> dispatcher.request_rider(Driver('Dee', Location(1, 1), 1))
+        >>> dispatcher.request_rider(Driver('Eve', Location(1, 5), 1))
+        >>> for name, column in [('Ann', 4), ('Bo', 1)]:
+        ...     rider = Rider(name, 10, Location(1, column), Location(2, 2))
+        ...     dispatcher.request_driver(rider)
+        >>> [(d.id, r.id) for d, r in dispatcher.match()]
+        [('Eve', 'Ann'), ('Dee', 'Bo')]
+        """
+        self._scheduled = False
+        self._release_stale()
+        riders = list(self.waiting_r.values())
+        if not riders or not self._drivers:
+            return []
+
+        # Find each rider's candidates, and group the riders into clusters
+        # that share no candidates, joined through the drivers they share.
+        if numpy is None or len(self._drivers) > DENSE_LIMIT:
+            candidates_of = [self._nearest(rider) for rider in riders]
+        else:
+            candidates_of = self._nearest_all(riders)
+        cluster_of = {}
+        for i, candidates in enumerate(candidates_of):
+            cluster_of[('r', i)] = ('r', i)
+            for driver, _ in candidates:
+                key = ('d', driver.id)
+                cluster_of.setdefault(key, key)
+                _union(cluster_of, ('r', i), key)
+
+        clusters = {}
+        for i in range(len(riders)):
+            clusters.setdefault(_find(cluster_of, ('r', i)), []).append(i)
+
+        pairs = []
+        for members in clusters.values():
+            drivers = list({driver.id: driver for i in members
+                            for driver, _ in candidates_of[i]}.values())
+            columns = {driver.id: j for j, driver in enumerate(drivers)}
+            costs = [[UNMATCHABLE] * len(drivers) for _ in members]
+            for row, i in enumerate(members):
+                for driver, cost in candidates_of[i]:
+                    costs[row][columns[driver.id]] = cost
+            for row, column in min_cost_matching(costs):
+                pairs.append((members[row], drivers[column]))
+
+        pairs.sort(key=lambda pair: pair[0])
+        matched = []
+        for i, driver in pairs:
+            rider = riders[i]
+            self._assign(driver, rider)
+            matched.append((driver, rider))
+        return matched
+
+    def _nearest(self, rider: Rider) -> List[Tuple[Driver, int]]:
+        """Return the rider's candidates, as (driver, drive time) pairs,
+        from the soonest drive up.
+
+        Drivers with the same drive time are ordered by the time they
+        became available.
+        """
+        origin = rider.origin
+        fastest = max(self._speeds)
+        entries = self._drivers.k_nearest(
+            origin, self.candidates,
+            lambda entry: (entry[1].get_drive_time(origin), entry[0]),
+            lambda distance: (round(round(distance / fastest) / fastest),
+                              -1))
+        return [(driver, driver.get_drive_time(origin))
+                for _, driver in entries]
+
+    def _nearest_all(self, riders: List[Rider]) \
+            -> List[List[Tuple[Driver, int]]]:
+        """Return the candidates of each of <riders>, as by _nearest().
+
+        The drive times from every available driver to the riders are
+        computed with numpy, in blocks of at most KERNEL_SIZE, and each
+        rider's candidates are picked from a row of them with a partial
+        sort, rather than with a search of the grid. This takes O(D) time
+        per rider for D drivers, while the search of the grid does not grow
+        with D, so it is only faster for up to DENSE_LIMIT drivers.
+        """
+        drivers = [driver for _, driver in sorted(self._drivers)]
+        count = len(drivers)
+        k = min(self.candidates, count)
+        rows = numpy.array([driver.location.row for driver in drivers])
+        columns = numpy.array([driver.location.column for driver in drivers])
+        speeds = numpy.array([driver.speed for driver in drivers])
+        # Each drive time is combined with the driver's position in the
+        # order in which the drivers became available, to break ties.
+        order = numpy.arange(count)
+        step = max(1, KERNEL_SIZE // count)
+        candidates_of = []
+        for start in range(0, len(riders), step):
+            block = riders[start:start + step]
+            times = drive_times(rows, columns, speeds,
+                                [rider.origin.row for rider in block],
+                                [rider.origin.column for rider in block])
+            keys = times.T * count + order
+            nearest = numpy.argpartition(keys, k - 1, axis=1)[:, :k]
+            nearest_keys = numpy.take_along_axis(keys, nearest, axis=1)
+            ranking = numpy.argsort(nearest_keys, axis=1)
+            nearest = numpy.take_along_axis(nearest, ranking, axis=1)
+            nearest_keys = numpy.take_along_axis(nearest_keys, ranking,
+                                                 axis=1)
+            for indexes, costs in zip(nearest.tolist(),
+                                      (nearest_keys // count).tolist()):
+                candidates_of.append([(drivers[j], cost)
+                                      for j, cost in zip(indexes, costs)])
+        return candidates_of
+
+    def _assign(self, driver: Driver, rider: Rider) -> None:
+        """Match the available driver to the waiting rider.
+
+        """
+        # Take the rider off the waiting list, once for every time they
+        # were put on it.
+        while rider.id in self.waiting_r:
+            self.cancel_ride(rider)
+        self._drivers.remove(driver.id)
+        self._speeds[driver.speed] -= 1
+        if not self._speeds[driver.speed]:
+            del self._speeds[driver.speed]
+        self._riders_of[driver.id] = rider
+        self._drivers_of[rider.id] = driver
+        driver.is_idle = False
+
+    def _release_stale(self) -> None:
+        """Make the matched drivers whose riders are no longer waiting
+        available to other riders again.
+
+        """
+        for driver_id, rider in list(self._riders_of.items()):
+            if rider.status != WAITING:
+                driver = self.available_d[driver_id]
+                del self._riders_of[driver_id]
+                del self._drivers_of[rider.id]
+                del self.available_d[driver_id]
+                self.mark_available(driver)
+
+
+def _find(parents: Dict[object, object], key: object) -> object:
+    """Return the representative of the set that <key> is in, in the
+    union-find forest <parents>.
+
+    """
+    root = key
+    while parents[root] != root:
+        root = parents[root]
+    while parents[key] != root:
+        parents[key], key = root, parents[key]
+    return root
+
+
+def _union(parents: Dict[object, object], first: object,
+           second: object) -> None:
+    """Join the sets that <first> and <second> are in, in the union-find
+    forest <parents>.
+
+    """
+    parents[_find(parents, first)] = _find(parents, second)
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all(config={'extra-imports': ['typing', 'driver', 'rider']})
+    python_ta.check_all(config={'extra-imports': ['collections', 'typing',
+                                                'driver', 'matching', 'rider',
+                                                'spatial', 'numpy']})
@@ -1,7 +1,10 @@
 """Drivers for the simulation"""
 
-from location import Location, manhattan_distance
+import sys
+from typing import Sequence
+from location import Location
 from rider import Rider
+from travel import TravelOracle, ManhattanOracle, divide_rounded
 
 
 class Driver:
@@ -11,8 +14,14 @@ class Driver:
     id: A unique identifier for the driver.
     location: The current location of the driver.
     is_idle: True if the driver is idle and False otherwise.
+    oracle: The travel-time oracle shared by all drivers, and by the
+        dispatchers through them. Pass an oracle to Simulation rather than
+        replacing this one, so that it is only used while that simulation
+        runs.
     """
 
+    oracle: TravelOracle = ManhattanOracle()
+
     id: str
     location: Location
     is_idle: bool
@@ -23,7 +32,7 @@ class Driver:
         """Initialize a Driver.
 
         """
-        self.id = identifier
+        self.id = sys.intern(identifier)
         self.location = location
         self.speed = speed
         self.is_idle = True
@@ -39,16 +48,35 @@ class Driver:
     def __eq__(self, other: object) -> bool:
         """Return True if self equals other, and false otherwise.
 
+        Drivers are equal iff they have the same id.
+
+        >>> Driver("Amaranth", Location(1, 1), 1) == \\
+        ...     Driver("Amaranth", Location(2, 2), 1)
+        True
+        """
+        return self is other or (isinstance(other, Driver)
+                                 and self.id == other.id)
+
+    def __hash__(self) -> int:
+        """Return a hash of this driver, which depends only on its id.
+
         """
-        return self.__str__() == other.__str__()
+        return hash(self.id)
 
     def get_travel_time(self, destination: Location) -> int:
         """Return the time it will take to arrive at the destination,
         rounded to the nearest integer.
 
         """
-        loc = manhattan_distance(self.location, destination)
-        return round(loc / self.speed)
+        return self.oracle.travel_time(self.location, destination,
+                                       self.speed)
+
+    def get_drive_time(self, location: Location) -> int:
+        """Return the time that a drive to the location would take, without
+        starting it.
+
+        """
+        return round(self.get_travel_time(location) / self.speed)
 
     def start_drive(self, location: Location) -> int:
         """Start driving to the location.
@@ -57,7 +85,7 @@ class Driver:
         """
         self.is_idle = False
         self.destination = location
-        return round(self.get_travel_time(location) / self.speed)
+        return self.get_drive_time(location)
 
     def end_drive(self) -> None:
         """End the drive and arrive at the destination.
@@ -76,8 +104,8 @@ class Driver:
         self.is_idle = False
         self.location = rider.origin
         self.destination = rider.destination
-        loc = manhattan_distance(rider.origin, rider.destination)
-        return round(loc / self.speed)
+        return self.oracle.travel_time(rider.origin, rider.destination,
+                                       self.speed)
 
     def end_ride(self) -> None:
         """End the current ride, and arrive at the rider's destination.
@@ -91,7 +119,43 @@ class Driver:
         self.destination = self.location
 
 
+def travel_times(rows: Sequence[int], columns: Sequence[int],
+                 speeds: Sequence[int], to_rows: Sequence[int],
+                 to_columns: Sequence[int]) -> object:
+    """Return the times it would take each of N drivers, at <rows> and
+    <columns> with <speeds>, to arrive at each of M locations, at <to_rows>
+    and <to_columns>, as an N by M matrix.
+
+    Each time is the same as Driver.get_travel_time would return. The
+    matrix is as for TravelOracle.travel_times.
+
+    >>> times = travel_times([0, 0], [0, 0], [1, 2], [1, 5], [2, 0])
+    >>> [[int(time) for time in row] for row in times]
+    [[3, 5], [2, 2]]
+    """
+    return Driver.oracle.travel_times(rows, columns, speeds, to_rows,
+                                      to_columns)
+
+
+def drive_times(rows: Sequence[int], columns: Sequence[int],
+                speeds: Sequence[int], to_rows: Sequence[int],
+                to_columns: Sequence[int]) -> object:
+    """Return the times that drives to each of M locations would take each
+    of N drivers, as an N by M matrix, where the arguments are as for
+    travel_times.
+
+    Each time is the same as Driver.get_drive_time would return.
+
+    >>> times = drive_times([0, 0], [0, 0], [1, 2], [1, 5], [2, 0])
+    >>> [[int(time) for time in row] for row in times]
+    [[3, 5], [1, 1]]
+    """
+    times = travel_times(rows, columns, speeds, to_rows, to_columns)
+    return divide_rounded(times, speeds)
+
+
 if __name__ == '__main__':
     import python_ta
     python_ta.check_all(
-        config={'extra-imports': ['location', 'rider']})
+        config={'extra-imports': ['sys', 'typing', 'location', 'rider',
+                                  'travel']})
@@ -1,10 +1,33 @@
-"""Locations for the simulation"""
+"""Locations for the simulation
+
+=== Constants ===
+INTERN_LIMIT: The largest number of locations kept in the interning table.
+"""
 
 from __future__ import annotations
+from typing import Dict, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+INTERN_LIMIT = 1 << 20
+
+# The interned locations, by (row, column), and by the strings they were
+# deserialized from.
+_INTERNED: Dict[Tuple[int, int], Location] = {}
+_DESERIALIZED: Dict[str, Location] = {}
 
 
 class Location:
-    """A two-dimensional location."""
+    """A two-dimensional location.
+
+    Locations are immutable and hashable, so they can be shared freely and
+    used as dictionary keys.
+    """
+
+    __slots__ = ('row', 'column')
 
     row: int
     column: int
@@ -13,8 +36,30 @@ class Location:
         """Initialize a location.
 
         """
-        self.row = row
-        self.column = column
+        object.__setattr__(self, 'row', row)
+        object.__setattr__(self, 'column', column)
+
+    def __setattr__(self, name: str, value: object) -> None:
+        """Raise an AttributeError, since locations are immutable.
+
+        >>> Location(1, 2).row = 3
+        Traceback (most recent call last):
+        ...
+        AttributeError: Location is immutable
+        """
+        raise AttributeError("Location is immutable")
+
+    def __delattr__(self, name: str) -> None:
+        """Raise an AttributeError, since locations are immutable.
+
+        """
+        raise AttributeError("Location is immutable")
+
+    def __reduce__(self) -> Tuple[type, Tuple[int, int]]:
+        """Return how to pickle this location.
+
+        """
+        return Location, (self.row, self.column)
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -27,7 +72,54 @@ class Location:
         """Return True if self equals other, and false otherwise.
 
         """
-        return self.row == other.row and self.column == other.column
+        return self is other or (self.row == other.row
+                                 and self.column == other.column)
+
+    def __hash__(self) -> int:
+        """Return a hash of this location.
+
+        >>> hash(Location(1, 2)) == hash(Location(1, 2))
+        True
+        """
+        return hash((self.row, self.column))
+
+    def pack(self) -> int:
+        """Return this location packed into a single integer.
+
+        Precondition: -2 ** 31 <= self.row, self.column < 2 ** 31.
+
+        >>> unpack_location(Location(-3, 7).pack()) == Location(-3, 7)
+        True
+        """
+        return (self.row << 32) | (self.column & 0xFFFFFFFF)
+
+
+def unpack_location(packed: int) -> Location:
+    """Return the location that was packed into <packed>.
+
+    """
+    column = packed & 0xFFFFFFFF
+    if column >= 1 << 31:
+        column -= 1 << 32
+    return intern_location(packed >> 32, column)
+
+
+def intern_location(row: int, column: int) -> Location:
+    """Return the shared location at <row> and <column>.
+
+    The same object is returned every time, unless the interning table has
+    reached INTERN_LIMIT locations.
+
+    >>> intern_location(3, 4) is intern_location(3, 4)
+    True
+    """
+    key = (row, column)
+    location = _INTERNED.get(key)
+    if location is None:
+        location = Location(row, column)
+        if len(_INTERNED) < INTERN_LIMIT:
+            _INTERNED[key] = location
+    return location
 
 
 def manhattan_distance(origin: Location, destination: Location) -> int:
@@ -39,16 +131,53 @@ def manhattan_distance(origin: Location, destination: Location) -> int:
     return a + b
 
 
+def manhattan_distances(rows: Sequence[int], columns: Sequence[int],
+                        to_rows: Sequence[int],
+                        to_columns: Sequence[int]) -> object:
+    """Return the Manhattan distances from each of the N locations at
+    <rows> and <columns> to each of the M locations at <to_rows> and
+    <to_columns>, as an N by M matrix.
+
+    The matrix is a numpy array of ints, computed in one vectorized
+    operation, if numpy is installed, and a list of N lists otherwise.
+    Either way, distances[i][j] is the distance from location i to
+    location j.
+
+    >>> distances = manhattan_distances([0, 2], [0, 3], [1, 2], [1, 0])
+    >>> [[int(distance) for distance in row] for row in distances]
+    [[2, 2], [3, 3]]
+    """
+    if numpy is None:
+        return [[abs(to_row - row) + abs(to_column - column)
+                 for to_row, to_column in zip(to_rows, to_columns)]
+                for row, column in zip(rows, columns)]
+    rows = numpy.asarray(rows, dtype=numpy.int64)[:, None]
+    columns = numpy.asarray(columns, dtype=numpy.int64)[:, None]
+    return (numpy.abs(numpy.asarray(to_rows, dtype=numpy.int64) - rows)
+            + numpy.abs(numpy.asarray(to_columns, dtype=numpy.int64)
+                        - columns))
+
+
 def deserialize_location(location_str: str) -> Location:
     """Deserialize a location.
 
+    Each location is interned, so deserializing the same place twice gives
+    the same object.
+
     location_str: A location in the format 'row,col'
-    """
 
-    num = location_str.split(',')
-    return Location(int(num[0]), int(num[1]))
+    >>> deserialize_location('3,4') is deserialize_location('3,4')
+    True
+    """
+    location = _DESERIALIZED.get(location_str)
+    if location is None:
+        num = location_str.split(',')
+        location = intern_location(int(num[0]), int(num[1]))
+        if len(_DESERIALIZED) < INTERN_LIMIT:
+            _DESERIALIZED[location_str] = location
+    return location
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all()
+    python_ta.check_all(config={'extra-imports': ['typing', 'numpy']})
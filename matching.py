@@ -0,0 +1,177 @@
+"""Min-cost matching for the simulation
+
+=== Constants ===
+UNMATCHABLE: The cost of a pair that must not be matched.
+"""
+
+import math
+from typing import List, Sequence, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+UNMATCHABLE = math.inf
+
+
+def min_cost_matching(costs: Sequence[Sequence[float]]) \
+        -> List[Tuple[int, int]]:
+    """Return a matching of the rows of <costs> to its columns, as a list of
+    (row, column) pairs in row order, where costs[row][column] is the cost
+    of matching row to column.
+
+    The matching matches as many rows as it can without using a pair whose
+    cost is UNMATCHABLE, and among those matchings, it has the least total
+    cost. It is found with the Hungarian algorithm, in O(n ** 2 * m) time
+    for n rows and m columns, or the reverse if there are more rows than
+    columns. The work is done by numpy if it is installed.
+
+    >>> min_cost_matching([[4, 1, 3], [2, 0, 5], [3, 2, 2]])
+    [(0, 1), (1, 0), (2, 2)]
+    >>> min_cost_matching([[1, UNMATCHABLE], [2, UNMATCHABLE]])
+    [(0, 0)]
+    >>> min_cost_matching([])
+    []
+    """
+    rows = len(costs)
+    columns = len(costs[0]) if rows else 0
+    if not rows or not columns:
+        return []
+    finite = [cost for row in costs for cost in row if cost != UNMATCHABLE]
+    if not finite:
+        return []
+
+    # Pairs that must not be matched get a cost so high that a matching
+    # with one more of them always costs more, so they are used only to
+    # fill out the square problem the algorithm solves.
+    lowest = min(finite)
+    forbidden = (max(finite) - lowest + 1) * (min(rows, columns) + 1)
+    matrix = [[cost - lowest if cost != UNMATCHABLE else forbidden
+               for cost in row] for row in costs]
+    transposed = rows > columns
+    if transposed:
+        matrix = [list(column) for column in zip(*matrix)]
+    if numpy is None:
+        assignment = _hungarian(matrix)
+    else:
+        assignment = _hungarian_numpy(numpy.array(matrix, dtype=float))
+
+    pairs = []
+    for row, column in enumerate(assignment):
+        if transposed:
+            row, column = column, row
+        if costs[row][column] != UNMATCHABLE:
+            pairs.append((row, column))
+    pairs.sort()
+    return pairs
+
+
+def _hungarian(matrix: List[List[float]]) -> List[int]:
+    """Return the column matched to each row of <matrix>, in a matching of
+    every row that has the least total cost.
+
+    Precondition: matrix has at least one row, and no more rows than
+    columns.
+    """
+    rows = len(matrix)
+    columns = len(matrix[0])
+    # Potentials of the rows and columns, and the row matched to each
+    # column, with row and column numbers starting at 1. Column 0 stands
+    # for the row being added.
+    u = [0.0] * (rows + 1)
+    v = [0.0] * (columns + 1)
+    match = [0] * (columns + 1)
+    way = [0] * (columns + 1)
+    for row in range(1, rows + 1):
+        match[0] = row
+        column = 0
+        lowest = [math.inf] * (columns + 1)
+        used = [False] * (columns + 1)
+        while True:
+            used[column] = True
+            current = match[column]
+            delta = math.inf
+            best = 0
+            for j in range(1, columns + 1):
+                if not used[j]:
+                    cost = matrix[current - 1][j - 1] - u[current] - v[j]
+                    if cost < lowest[j]:
+                        lowest[j] = cost
+                        way[j] = column
+                    if lowest[j] < delta:
+                        delta = lowest[j]
+                        best = j
+            for j in range(columns + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    lowest[j] -= delta
+            column = best
+            if match[column] == 0:
+                break
+        # Flip the augmenting path that ends at the free column.
+        while column:
+            previous = way[column]
+            match[column] = match[previous]
+            column = previous
+
+    assignment = [0] * rows
+    for column in range(1, columns + 1):
+        if match[column]:
+            assignment[match[column] - 1] = column - 1
+    return assignment
+
+
+def _hungarian_numpy(matrix: object) -> List[int]:
+    """Return the column matched to each row of the numpy array <matrix>,
+    as by _hungarian, working on whole rows of it at a time.
+
+    """
+    rows, columns = matrix.shape
+    u = numpy.zeros(rows)
+    v = numpy.zeros(columns)
+    match = numpy.full(columns, -1)
+    way = numpy.full(columns, -1)
+    lowest = numpy.empty(columns)
+    used = numpy.empty(columns, dtype=bool)
+    for row in range(rows):
+        # Column -1 stands for the row being added, as column 0 does in
+        # _hungarian.
+        lowest.fill(math.inf)
+        used.fill(False)
+        current = row
+        column = -1
+        while True:
+            costs = matrix[current] - u[current] - v
+            better = ~used & (costs < lowest)
+            lowest[better] = costs[better]
+            way[better] = column
+            candidates = numpy.where(used, math.inf, lowest)
+            best = int(numpy.argmin(candidates))
+            delta = candidates[best]
+            u[row] += delta
+            u[match[used]] += delta
+            v[used] -= delta
+            lowest[~used] -= delta
+            used[best] = True
+            column = best
+            if match[column] < 0:
+                break
+            current = match[column]
+        while column >= 0:
+            previous = way[column]
+            match[column] = match[previous] if previous >= 0 else row
+            column = previous
+
+    assignment = [0] * rows
+    for column in numpy.flatnonzero(match >= 0):
+        assignment[match[column]] = int(column)
+    return assignment
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['math', 'typing',
+                                                  'numpy']})
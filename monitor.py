@@ -14,10 +14,24 @@ REQUEST: A constant used for the request activity description.
 CANCEL: A constant used for the cancel activity description.
 PICKUP: A constant used for the pickup activity description.
 DROPOFF: A constant used for the dropoff activity description.
+PERCENTILES: The fractions of the percentiles reported by a MetricsMonitor.
+CONFIDENCE_Z: The number of standard errors in the error bounds reported by
+    a SampledMonitor, for a 95% confidence interval.
 """
 
-from typing import Dict, List
-from location import Location
+import math
+import sqlite3
+import zlib
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+from location import Location, manhattan_distance
+from registry import IdRegistry
+from sketch import KLLSketch
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 RIDER = "rider"
 DRIVER = "driver"
@@ -27,6 +41,13 @@ CANCEL = "cancel"
 PICKUP = "pickup"
 DROPOFF = "dropoff"
 
+PERCENTILES = (0.5, 0.95, 0.99)
+CONFIDENCE_Z = 1.96
+
+# The code of each category and description in a ColumnarMonitor's log.
+_CATEGORY_CODES = {RIDER: 0, DRIVER: 1}
+_DESCRIPTION_CODES = {REQUEST: 0, CANCEL: 1, PICKUP: 2, DROPOFF: 3}
+
 
 class Activity:
     """An activity that occurs in the simulation.
@@ -57,6 +78,21 @@ class Activity:
 class Monitor:
     """A monitor keeps a record of activities that it is notified about.
     When required, it generates a report of the activities it has recorded.
+
+    Once a rider cancels or is dropped off, their wait time is added to a
+    running total and their activities are forgotten, so the record does
+    not grow with the number of riders that have finished. An identifier
+    reused after that is taken to be a new rider, whose wait time counts
+    too.
+
+    >>> monitor = Monitor()
+    >>> monitor.notify(0, DRIVER, REQUEST, 'Dale', Location(1, 1))
+    >>> monitor.notify(0, RIDER, REQUEST, 'Rita', Location(1, 1))
+    >>> monitor.notify(2, RIDER, CANCEL, 'Rita', Location(1, 1))
+    >>> monitor.notify(3, RIDER, REQUEST, 'Rita', Location(1, 1))
+    >>> monitor.notify(7, RIDER, CANCEL, 'Rita', Location(1, 1))
+    >>> monitor.report()["rider_wait_time"]
+    3.0
     """
 
     # === Private Attributes ===
@@ -64,6 +100,14 @@ class Monitor:
     #       A dictionary whose key is a category, and value is another
     #       dictionary. The key of the second dictionary is an identifier
     #       and its value is a list of Activities.
+    _retired: int
+    #       The number of riders that have cancelled or been dropped off.
+    _retired_wait_time: int
+    #       The total wait time of the riders that have cancelled or been
+    #       dropped off.
+    _retired_waits: int
+    #       The number of riders that have cancelled or been dropped off
+    #       after they stopped waiting.
 
     def __init__(self) -> None:
         """Initialize a Monitor.
@@ -74,13 +118,17 @@ class Monitor:
             DRIVER: {}
         }
         """@type _activities: dict[str, dict[str, list[Activity]]]"""
+        self._retired = 0
+        self._retired_wait_time = 0
+        self._retired_waits = 0
 
     def __str__(self) -> str:
         """Return a string representation.
 
         """
         return "Monitor ({} drivers, {} riders)".format(
-            len(self._activities[DRIVER]), len(self._activities[RIDER]))
+            len(self._activities[DRIVER]),
+            len(self._activities[RIDER]) + self._retired)
 
     def notify(self, timestamp: int, category: str, description: str,
                identifier: str, location: Location) -> None:
@@ -99,6 +147,21 @@ class Monitor:
         activity = Activity(timestamp, description, identifier, location)
         self._activities[category][identifier].append(activity)
 
+        if category == RIDER and (description == CANCEL
+                                  or description == DROPOFF):
+            self._retire_rider(identifier)
+
+    def _retire_rider(self, identifier: str) -> None:
+        """Add the wait time of the rider with <identifier> to the running
+        total, and forget their activities.
+
+        """
+        activities = self._activities[RIDER].pop(identifier)
+        if len(activities) >= 2:
+            self._retired_wait_time += activities[1].time - activities[0].time
+            self._retired_waits += 1
+        self._retired += 1
+
     def report(self) -> Dict[str, float]:
         """Return a report of the activities that have occurred.
 
@@ -112,8 +175,8 @@ class Monitor:
         up or have cancelled their ride.
 
         """
-        wait_time = 0
-        count = 0
+        wait_time = self._retired_wait_time
+        count = self._retired_waits
         for activities in self._activities[RIDER].values():
             # A rider that has less than two activities hasn't finished
             # waiting (they haven't cancelled or been picked up).
@@ -156,9 +219,976 @@ class Monitor:
         return total / len(self._activities[DRIVER])
 
 
+class _DriverTotals:
+    """The running totals of one driver's activities.
+
+    === Attributes ===
+    location: The location of the driver's latest activity.
+    stops: The number of pickups and dropoffs of the driver.
+    first_stop: The location of the driver's first pickup or dropoff, or
+        None if there is none.
+    last_stop: The location of the driver's latest pickup or dropoff, or
+        None if there is none.
+    ride_distance: The total distance from the first stop to the second,
+        the third to the fourth, and so on.
+    shifted_distance: The total distance from the second stop to the
+        third, the fourth to the fifth, and so on.
+    """
+
+    __slots__ = ('location', 'stops', 'first_stop', 'last_stop',
+                 'ride_distance', 'shifted_distance')
+
+    location: Location
+    stops: int
+    first_stop: Optional[Location]
+    last_stop: Optional[Location]
+    ride_distance: int
+    shifted_distance: int
+
+    def __init__(self, location: Location) -> None:
+        """Initialize the totals of a driver whose first activity was at
+        <location>.
+
+        """
+        self.location = location
+        self.stops = 0
+        self.first_stop = None
+        self.last_stop = None
+        self.ride_distance = 0
+        self.shifted_distance = 0
+
+    def add_stop(self, location: Location) -> None:
+        """Add a pickup or dropoff at <location>.
+
+        """
+        if self.stops == 0:
+            self.first_stop = location
+        elif self.stops % 2 == 1:
+            self.ride_distance += manhattan_distance(self.last_stop, location)
+        else:
+            self.shifted_distance += manhattan_distance(self.last_stop,
+                                                        location)
+        self.last_stop = location
+        self.stops += 1
+
+
+class StreamingMonitor(Monitor):
+    """A monitor that keeps running totals of the activities it is notified
+    about, instead of a record of every activity.
+
+    Its report is the same as that of a Monitor notified of the same
+    activities, but it remembers only the latest location of each driver
+    and the request time of each rider still waiting. A rider is forgotten
+    once they cancel or are dropped off, so an identifier reused after that
+    counts as a new rider. The report can be made at any time, without
+    revisiting past activities.
+
+    >>> monitor = StreamingMonitor()
+    >>> monitor.notify(0, DRIVER, REQUEST, 'Dale', Location(1, 1))
+    >>> monitor.notify(1, RIDER, REQUEST, 'Rita', Location(1, 3))
+    >>> monitor.notify(3, DRIVER, PICKUP, 'Dale', Location(1, 3))
+    >>> monitor.notify(3, RIDER, PICKUP, 'Rita', Location(1, 3))
+    >>> monitor.notify(7, DRIVER, DROPOFF, 'Dale', Location(5, 3))
+    >>> monitor.notify(7, RIDER, DROPOFF, 'Rita', Location(5, 3))
+    >>> monitor.report() == {'rider_wait_time': 2.0,
+    ...                      'driver_total_distance': 6.0,
+    ...                      'driver_ride_distance': 4.0}
+    True
+    """
+
+    # === Private Attributes ===
+    _riders: Dict[str, Optional[int]]
+    #     A dictionary whose key is the identifier of a rider that has not
+    #     yet cancelled or been dropped off, and value is the time of their
+    #     request, or None if they have already stopped waiting.
+    _retired: int
+    #     The number of riders that have cancelled or been dropped off.
+    _wait_time: int
+    #     The total wait time of the riders that have stopped waiting.
+    _waited: int
+    #     The number of riders that have stopped waiting.
+    _drivers: Dict[str, _DriverTotals]
+    #     The running totals of each driver, in the order in which the
+    #     drivers were first notified about.
+    _total_distance: int
+    #     The total distance between consecutive activities of each driver.
+    _ride_distance: int
+    #     The sum of the ride distances of every driver.
+    _odd_drivers: int
+    #     The number of drivers with an odd number of pickups and dropoffs.
+    #
+    # === Representation Invariants ===
+    # _waited is the number of None values in _riders plus the number of
+    # riders that stopped waiting before they were retired.
+
+    def __init__(self) -> None:
+        """Initialize a StreamingMonitor.
+
+        """
+        super().__init__()
+        self._riders = {}
+        self._retired = 0
+        self._wait_time = 0
+        self._waited = 0
+        self._drivers = {}
+        self._total_distance = 0
+        self._ride_distance = 0
+        self._odd_drivers = 0
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        return "Monitor ({} drivers, {} riders)".format(
+            len(self._drivers), len(self._riders) + self._retired)
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or RIDER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROP_OFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        if category == RIDER:
+            self._notify_rider(timestamp, description, identifier)
+            return
+
+        totals = self._drivers.get(identifier)
+        if totals is None:
+            self._drivers[identifier] = _DriverTotals(location)
+            totals = self._drivers[identifier]
+        else:
+            self._total_distance += manhattan_distance(totals.location,
+                                                       location)
+            totals.location = location
+        if description == PICKUP or description == DROPOFF:
+            self._ride_distance -= totals.ride_distance
+            self._odd_drivers -= totals.stops % 2
+            totals.add_stop(location)
+            self._ride_distance += totals.ride_distance
+            self._odd_drivers += totals.stops % 2
+
+    def _notify_rider(self, timestamp: int, description: str,
+                      identifier: str) -> None:
+        """Record the rider activity with <description> at <timestamp> by
+        the rider with <identifier>.
+
+        """
+        if identifier not in self._riders:
+            self._riders[identifier] = timestamp
+            return
+        requested = self._riders[identifier]
+        if requested is not None:
+            # The second activity of a rider ends their wait.
+            self._wait_time += timestamp - requested
+            self._waited += 1
+            self._riders[identifier] = None
+        if description == CANCEL or description == DROPOFF:
+            del self._riders[identifier]
+            self._retired += 1
+
+    def _average_wait_time(self) -> float:
+        """Return the average wait time of riders that have either been picked
+        up or have cancelled their ride.
+
+        """
+        return self._wait_time / self._waited
+
+    def _average_total_distance(self) -> float:
+        """Return the average distance drivers have driven.
+
+        """
+        return self._total_distance / len(self._drivers)
+
+    def _average_ride_distance(self) -> float:
+        """Return the average distance drivers have driven on rides.
+
+        """
+        if not self._odd_drivers:
+            return self._ride_distance / len(self._drivers)
+
+        # A Monitor pairs up the pickups and dropoffs of all the drivers in
+        # one sequence, so a driver with an odd number of them shifts the
+        # pairs of every driver after it by one.
+        total = 0
+        shifted = False
+        last_stop = None
+        for totals in self._drivers.values():
+            if not totals.stops:
+                continue
+            if shifted:
+                total += manhattan_distance(last_stop, totals.first_stop)
+                total += totals.shifted_distance
+            else:
+                total += totals.ride_distance
+            if totals.stops % 2:
+                shifted = not shifted
+            last_stop = totals.last_stop
+        return total / len(self._drivers)
+
+
+class _Window:
+    """The rider activities in one window of simulated time.
+
+    === Attributes ===
+    start: The first time in the window.
+    requests: The number of ride requests.
+    cancellations: The number of cancelled rides.
+    pickups: The number of pickups.
+    dropoffs: The number of dropoffs.
+    wait_time: The total wait time of the riders whose wait ended.
+    waits: A sketch of the wait times of the riders whose wait ended.
+    """
+
+    __slots__ = ('start', 'requests', 'cancellations', 'pickups',
+                 'dropoffs', 'wait_time', 'waits')
+
+    start: int
+    requests: int
+    cancellations: int
+    pickups: int
+    dropoffs: int
+    wait_time: int
+    waits: KLLSketch
+
+    def __init__(self, start: int, k: int) -> None:
+        """Initialize an empty window that starts at <start>, with a sketch
+        of accuracy parameter <k>.
+
+        """
+        self.start = start
+        self.requests = 0
+        self.cancellations = 0
+        self.pickups = 0
+        self.dropoffs = 0
+        self.wait_time = 0
+        self.waits = KLLSketch(k)
+
+
+class MetricsMonitor(StreamingMonitor):
+    """A streaming monitor that also reports percentiles of rider wait
+    times and trip distances, overall and per window of simulated time.
+
+    Wait times and trip distances are kept in quantile sketches, and the
+    rider activities are also counted in tumbling windows of <window>
+    time units, each with its own sketch of wait times. A wait is counted
+    in the window in which it ends. The memory used is bounded by the
+    number of live riders and drivers and the number of windows kept.
+
+    >>> monitor = MetricsMonitor(window=10)
+    >>> monitor.notify(0, DRIVER, REQUEST, 'Dale', Location(1, 1))
+    >>> monitor.notify(1, RIDER, REQUEST, 'Rita', Location(1, 3))
+    >>> monitor.notify(3, DRIVER, PICKUP, 'Dale', Location(1, 3))
+    >>> monitor.notify(3, RIDER, PICKUP, 'Rita', Location(1, 3))
+    >>> monitor.notify(17, DRIVER, DROPOFF, 'Dale', Location(5, 3))
+    >>> monitor.notify(17, RIDER, DROPOFF, 'Rita', Location(5, 3))
+    >>> monitor.report()['trip_distance_p50']
+    4
+    >>> [(w['start'], w['pickups'], w['dropoffs'])
+    ...  for w in monitor.window_report()]
+    [(0, 1, 0), (10, 0, 1)]
+
+    === Attributes ===
+    window: The length of each window, in time units.
+    """
+
+    window: int
+
+    # === Private Attributes ===
+    _k: int
+    #     The accuracy parameter of the sketches.
+    _max_windows: Optional[int]
+    #     The most windows to keep, or None to keep them all.
+    _waits: KLLSketch
+    #     A sketch of the wait times of all the riders whose wait ended.
+    _trips: KLLSketch
+    #     A sketch of the distances from pickup to dropoff of all the
+    #     riders dropped off.
+    _pickups: Dict[str, Location]
+    #     A dictionary whose key is the identifier of a rider picked up but
+    #     not yet dropped off, and value is where they were picked up.
+    _windows: Dict[int, _Window]
+    #     A dictionary whose key is the index of a window, and value is the
+    #     window, in the order in which the windows were started.
+
+    def __init__(self, window: int = 60, k: int = 200,
+                 max_windows: Optional[int] = None) -> None:
+        """Initialize a MetricsMonitor with windows of <window> time units
+        and sketches of accuracy parameter <k>.
+
+        If <max_windows> is not None, only that many of the latest windows
+        are kept.
+
+        Precondition: window > 0.
+        """
+        super().__init__()
+        self.window = window
+        self._k = k
+        self._max_windows = max_windows
+        self._waits = KLLSketch(k)
+        self._trips = KLLSketch(k)
+        self._pickups = {}
+        self._windows = {}
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or RIDER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROP_OFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        if category == RIDER:
+            window = self._window_at(timestamp)
+            # The riders' request times are those kept by StreamingMonitor.
+            requested = self._riders.get(identifier)
+            if requested is not None:
+                self._waits.add(timestamp - requested)
+                window.waits.add(timestamp - requested)
+                window.wait_time += timestamp - requested
+            if description == REQUEST:
+                window.requests += 1
+            elif description == CANCEL:
+                window.cancellations += 1
+                self._pickups.pop(identifier, None)
+            elif description == PICKUP:
+                window.pickups += 1
+                self._pickups[identifier] = location
+            elif description == DROPOFF:
+                window.dropoffs += 1
+                origin = self._pickups.pop(identifier, None)
+                if origin is not None:
+                    self._trips.add(manhattan_distance(origin, location))
+        super().notify(timestamp, category, description, identifier,
+                       location)
+
+    def report(self) -> Dict[str, float]:
+        """Return a report of the activities that have occurred.
+
+        Besides the averages reported by a Monitor, the report holds the
+        PERCENTILES of the rider wait time and the trip distance, e.g.
+        'rider_wait_time_p95'. A percentile of no values is NaN.
+        """
+        report = super().report()
+        report.update(_percentiles("rider_wait_time", self._waits))
+        report.update(_percentiles("trip_distance", self._trips))
+        return report
+
+    def window_report(self) -> List[Dict[str, float]]:
+        """Return a report of the rider activities in each window kept, in
+        the order in which the windows were started.
+
+        Each report holds the start of its window, the numbers of
+        'requests', 'cancellations', 'pickups' and 'dropoffs', and the
+        average and PERCENTILES of the 'rider_wait_time'. The average and
+        percentiles of no wait times are NaN.
+        """
+        reports = []
+        for window in self._windows.values():
+            report = {"start": window.start,
+                      "requests": window.requests,
+                      "cancellations": window.cancellations,
+                      "pickups": window.pickups,
+                      "dropoffs": window.dropoffs,
+                      "rider_wait_time": (window.wait_time / len(window.waits)
+                                          if len(window.waits)
+                                          else math.nan)}
+            report.update(_percentiles("rider_wait_time", window.waits))
+            reports.append(report)
+        return reports
+
+    def _window_at(self, timestamp: int) -> _Window:
+        """Return the window that contains <timestamp>, starting it if it
+        has not been started.
+
+        """
+        index = timestamp // self.window
+        window = self._windows.get(index)
+        if window is None:
+            window = _Window(index * self.window, self._k)
+            self._windows[index] = window
+            if (self._max_windows is not None
+                    and len(self._windows) > self._max_windows):
+                del self._windows[next(iter(self._windows))]
+        return window
+
+
+def _percentiles(name: str, sketch: KLLSketch) -> Dict[str, float]:
+    """Return the PERCENTILES of the values in <sketch>, by <name> and the
+    percentile, e.g. name_p50, or NaN if <sketch> is empty.
+
+    """
+    return {"{}_p{:g}".format(name, fraction * 100):
+            sketch.quantile(fraction) if len(sketch) else math.nan
+            for fraction in PERCENTILES}
+
+
+class SampledMonitor(Monitor):
+    """A monitor that records the activities of only a sample of the riders
+    and drivers, and estimates the report from them.
+
+    A rider or driver is in the sample iff the hash of their identifier, as
+    a fraction of 2 ** 32, is less than the sample rate, so the same actors
+    are sampled in every run. The hash is the CRC-32 of the identifier,
+    mixed by the finalizer of MurmurHash3: the CRC-32 alone is linear, and
+    samples runs of sequential identifiers, such as 'R0', 'R1', ..., in
+    clumps, which the error bounds do not allow for. The averages in the
+    report are those of the sampled actors, which estimate the averages of
+    all actors without bias. For each average, the report also holds an
+    error bound: CONFIDENCE_Z standard errors of the estimate, under the
+    key of the average followed by '_error'. The bound assumes that the
+    sample is a simple random sample of the actors, which holds as long as
+    the hash splits the identifiers uniformly.
+
+    >>> monitor = SampledMonitor(1.0)
+    >>> monitor.notify(0, DRIVER, REQUEST, 'Dale', Location(1, 1))
+    >>> monitor.notify(1, RIDER, REQUEST, 'Rita', Location(1, 3))
+    >>> monitor.notify(3, DRIVER, PICKUP, 'Dale', Location(1, 3))
+    >>> monitor.notify(3, RIDER, PICKUP, 'Rita', Location(1, 3))
+    >>> monitor.report()['rider_wait_time']
+    2.0
+    >>> SampledMonitor(0.5).is_sampled('Dale')
+    True
+
+    === Attributes ===
+    rate: The fraction of the riders and drivers that are sampled.
+    """
+
+    rate: float
+
+    # === Private Attributes ===
+    _threshold: int
+    #     The CRC-32 that an identifier must be below to be sampled.
+    _wait_squares: int
+    #     The sum of the squares of the wait times of the retired riders.
+
+    def __init__(self, rate: float) -> None:
+        """Initialize a SampledMonitor that samples <rate> of the riders and
+        drivers.
+
+        Precondition: 0 < rate <= 1.
+        """
+        super().__init__()
+        self.rate = rate
+        self._threshold = int(rate * 2 ** 32)
+        self._wait_squares = 0
+
+    def is_sampled(self, identifier: str) -> bool:
+        """Return True iff the rider or driver with <identifier> is in the
+        sample.
+
+        """
+        return _sample_hash(identifier) < self._threshold
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity, which is recorded only if
+        its actor is in the sample.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or RIDER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROP_OFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        if _sample_hash(identifier) < self._threshold:
+            super().notify(timestamp, category, description, identifier,
+                           location)
+
+    def report(self) -> Dict[str, float]:
+        """Return a report of the estimated averages of all the riders and
+        drivers, each with its error bound.
+
+        """
+        report = super().report()
+        waits = [activities[1].time - activities[0].time
+                 for activities in self._activities[RIDER].values()
+                 if len(activities) >= 2]
+        report["rider_wait_time_error"] = self._error(
+            sum(waits) + self._retired_wait_time,
+            sum(wait * wait for wait in waits) + self._wait_squares,
+            len(waits) + self._retired_waits)
+
+        # Monitor pairs the pickups and dropoffs of all the drivers in one
+        # sequence, driver by driver, so a pair may span two drivers. Each
+        # pair's distance is counted for the driver of its first stop, so
+        # that the values average to exactly the reported estimate.
+        totals = []
+        rides = []
+        start = None
+        for activities in self._activities[DRIVER].values():
+            totals.append(sum(
+                manhattan_distance(activity.location, after.location)
+                for activity, after in zip(activities, activities[1:])))
+            rides.append(0)
+            for activity in activities:
+                if activity.description in (PICKUP, DROPOFF):
+                    if start is None:
+                        start = (len(rides) - 1, activity.location)
+                    else:
+                        rides[start[0]] += manhattan_distance(
+                            start[1], activity.location)
+                        start = None
+        for name, values in (("driver_total_distance", totals),
+                             ("driver_ride_distance", rides)):
+            report[name + "_error"] = self._error(
+                sum(values), sum(value * value for value in values),
+                len(values))
+        return report
+
+    def _retire_rider(self, identifier: str) -> None:
+        """Add the wait time of the rider with <identifier> to the running
+        totals, and forget their activities.
+
+        """
+        activities = self._activities[RIDER][identifier]
+        if len(activities) >= 2:
+            wait = activities[1].time - activities[0].time
+            self._wait_squares += wait * wait
+        super()._retire_rider(identifier)
+
+    def _error(self, total: float, squares: float, count: int) -> float:
+        """Return the error bound of the average of <count> sampled values,
+        whose sum is <total> and sum of squares is <squares>, or NaN if
+        there are fewer than two values.
+
+        """
+        if count < 2:
+            return math.nan
+        variance = max(0.0, (squares - total * total / count) / (count - 1))
+        # Sampling without replacement: the larger the sample, the less of
+        # the population is left to be wrong about.
+        return CONFIDENCE_Z * math.sqrt((1 - self.rate) * variance / count)
+
+
+def _sample_hash(identifier: str) -> int:
+    """Return the 32-bit hash of <identifier> that decides whether it is
+    sampled.
+
+    """
+    value = zlib.crc32(identifier.encode())
+    value ^= value >> 16
+    value = (value * 0x85EBCA6B) & 0xFFFFFFFF
+    value ^= value >> 13
+    value = (value * 0xC2B2AE35) & 0xFFFFFFFF
+    return value ^ (value >> 16)
+
+
+class ColumnarMonitor(Monitor):
+    """A monitor that keeps a record of every activity in columns.
+
+    Each activity takes one entry in each of a few typed arrays, rather
+    than an Activity and a Location object, and actors are numbered
+    densely in the order in which they are first notified about. The
+    report is the same as that of a Monitor notified of the same
+    activities. It is computed with vectorized operations if numpy is
+    installed, and with plain loops over the columns otherwise.
+
+    >>> monitor = ColumnarMonitor()
+    >>> monitor.notify(0, DRIVER, REQUEST, 'Dale', Location(1, 1))
+    >>> monitor.notify(1, RIDER, REQUEST, 'Rita', Location(1, 3))
+    >>> monitor.notify(3, DRIVER, PICKUP, 'Dale', Location(1, 3))
+    >>> monitor.notify(3, RIDER, PICKUP, 'Rita', Location(1, 3))
+    >>> monitor.notify(7, DRIVER, DROPOFF, 'Dale', Location(5, 3))
+    >>> monitor.notify(7, RIDER, DROPOFF, 'Rita', Location(5, 3))
+    >>> monitor.report() == {'rider_wait_time': 2.0,
+    ...                      'driver_total_distance': 6.0,
+    ...                      'driver_ride_distance': 4.0}
+    True
+    >>> monitor.notify(8, RIDER, REQUEST, 'Rita', Location(5, 3))
+    >>> monitor.notify(12, RIDER, CANCEL, 'Rita', Location(5, 3))
+    >>> monitor.report()['rider_wait_time']
+    3.0
+    """
+
+    # === Private Attributes ===
+    _actors: Dict[str, IdRegistry]
+    #     A dictionary whose key is a category, and value is the registry
+    #     that numbers the actors of that category.
+    _times: array
+    #     The time of each activity, in the order notified.
+    _categories: array
+    #     The code of the category of each activity, in _CATEGORY_CODES.
+    _descriptions: array
+    #     The code of the description of each activity, in
+    #     _DESCRIPTION_CODES.
+    _indexes: array
+    #     The index of the actor of each activity in its category's registry.
+    _rows: array
+    #     The row of the location of each activity.
+    _columns: array
+    #     The column of the location of each activity.
+    #
+    # === Representation Invariants ===
+    # The arrays all have the same length.
+
+    def __init__(self) -> None:
+        """Initialize a ColumnarMonitor.
+
+        """
+        super().__init__()
+        self._actors = {RIDER: IdRegistry(), DRIVER: IdRegistry()}
+        self._times = array('q')
+        self._categories = array('B')
+        self._descriptions = array('B')
+        self._indexes = array('l')
+        self._rows = array('l')
+        self._columns = array('l')
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        return "Monitor ({} drivers, {} riders)".format(
+            len(self._actors[DRIVER]), len(self._actors[RIDER]))
+
+    def __len__(self) -> int:
+        """Return the number of activities recorded.
+
+        """
+        return len(self._times)
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or RIDER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROP_OFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        self._times.append(timestamp)
+        self._categories.append(_CATEGORY_CODES[category])
+        self._descriptions.append(_DESCRIPTION_CODES[description])
+        self._indexes.append(self._actors[category].index(identifier))
+        self._rows.append(location.row)
+        self._columns.append(location.column)
+
+    def _average_wait_time(self) -> float:
+        """Return the average wait time of riders that have either been picked
+        up or have cancelled their ride.
+
+        """
+        # As in a Monitor, the activities of a rider after they cancel or
+        # are dropped off are those of a new rider with the same id.
+        finished = (_DESCRIPTION_CODES[CANCEL], _DESCRIPTION_CODES[DROPOFF])
+        if numpy is None:
+            first = {}
+            wait_time = 0
+            count = 0
+            for i in self._positions(RIDER):
+                rider = self._indexes[i]
+                if rider not in first:
+                    first[rider] = self._times[i]
+                elif first[rider] is not None:
+                    wait_time += self._times[i] - first[rider]
+                    count += 1
+                    first[rider] = None
+                if self._descriptions[i] in finished:
+                    del first[rider]
+            return wait_time / count
+
+        # The wait of a rider is the time from their first activity to their
+        # second, so sort the activities by rider, keeping them in order,
+        # split them where the rider changes or has just finished, and take
+        # the first two of each part that has two.
+        positions = self._positions(RIDER)
+        riders = self._column(self._indexes)[positions]
+        order = numpy.argsort(riders, kind='stable')
+        riders = riders[order]
+        times = self._column(self._times)[positions][order]
+        ends = numpy.isin(self._column(self._descriptions)[positions][order],
+                          finished)
+        starts = numpy.flatnonzero(
+            numpy.r_[True, (riders[1:] != riders[:-1]) | ends[:-1]])
+        starts = starts[(starts + 1 < len(riders))]
+        starts = starts[(riders[starts + 1] == riders[starts]) & ~ends[starts]]
+        return int((times[starts + 1] - times[starts]).sum()) / len(starts)
+
+    def _average_total_distance(self) -> float:
+        """Return the average distance drivers have driven.
+
+        """
+        if numpy is None:
+            total = 0
+            last = {}
+            for i in self._positions(DRIVER):
+                driver = self._indexes[i]
+                if driver in last:
+                    j = last[driver]
+                    total += abs(self._rows[i] - self._rows[j])
+                    total += abs(self._columns[i] - self._columns[j])
+                last[driver] = i
+            return total / len(self._actors[DRIVER])
+
+        positions = self._positions(DRIVER)
+        drivers = self._column(self._indexes)[positions]
+        positions = positions[numpy.argsort(drivers, kind='stable')]
+        drivers = self._column(self._indexes)[positions]
+        same = drivers[1:] == drivers[:-1]
+        total = 0
+        for column in (self._rows, self._columns):
+            steps = numpy.abs(numpy.diff(self._column(column)[positions]))
+            total += int(steps[same].sum())
+        return total / len(self._actors[DRIVER])
+
+    def _average_ride_distance(self) -> float:
+        """Return the average distance drivers have driven on rides.
+
+        """
+        # Like a Monitor, pair up the pickups and dropoffs of every driver in
+        # one sequence, ordered by driver and then by time.
+        if numpy is None:
+            stops = {}
+            for i in self._positions(DRIVER):
+                if self._descriptions[i] >= _DESCRIPTION_CODES[PICKUP]:
+                    stops.setdefault(self._indexes[i], []).append(i)
+            ordered = [i for driver in sorted(stops) for i in stops[driver]]
+            total = 0
+            for i, j in zip(ordered[0::2], ordered[1::2]):
+                total += abs(self._rows[j] - self._rows[i])
+                total += abs(self._columns[j] - self._columns[i])
+            return total / len(self._actors[DRIVER])
+
+        positions = self._positions(DRIVER)
+        positions = positions[self._column(self._descriptions)[positions]
+                              >= _DESCRIPTION_CODES[PICKUP]]
+        drivers = self._column(self._indexes)[positions]
+        positions = positions[numpy.argsort(drivers, kind='stable')]
+        pairs = len(positions) // 2
+        total = 0
+        for column in (self._rows, self._columns):
+            values = self._column(column)[positions]
+            total += int(numpy.abs(values[1:2 * pairs:2]
+                                   - values[0:2 * pairs:2]).sum())
+        return total / len(self._actors[DRIVER])
+
+    def _positions(self, category: str) -> object:
+        """Return the positions in the log of the activities in <category>,
+        in order, as a numpy array if numpy is installed and as an iterator
+        otherwise.
+
+        """
+        code = _CATEGORY_CODES[category]
+        if numpy is None:
+            return (i for i, c in enumerate(self._categories) if c == code)
+        return numpy.flatnonzero(self._column(self._categories) == code)
+
+    @staticmethod
+    def _column(column: array) -> object:
+        """Return a numpy view of <column>, without copying it.
+
+        """
+        return numpy.frombuffer(column, dtype=column.typecode)
+
+
+class SpillingMonitor(Monitor):
+    """A monitor that keeps a record of every activity in an SQLite
+    database, so that the record is not limited by memory.
+
+    Activities are buffered in memory and inserted into the database in
+    bulk whenever <buffer_size> of them have been buffered. The report is
+    computed by SQL queries over the database, and is the same as that of
+    a Monitor notified of the same activities.
+
+    >>> monitor = SpillingMonitor(buffer_size=2)
+    >>> monitor.notify(0, DRIVER, REQUEST, 'Dale', Location(1, 1))
+    >>> monitor.notify(1, RIDER, REQUEST, 'Rita', Location(1, 3))
+    >>> monitor.notify(3, DRIVER, PICKUP, 'Dale', Location(1, 3))
+    >>> monitor.notify(3, RIDER, PICKUP, 'Rita', Location(1, 3))
+    >>> monitor.notify(7, DRIVER, DROPOFF, 'Dale', Location(5, 3))
+    >>> monitor.notify(7, RIDER, DROPOFF, 'Rita', Location(5, 3))
+    >>> monitor.report() == {'rider_wait_time': 2.0,
+    ...                      'driver_total_distance': 6.0,
+    ...                      'driver_ride_distance': 4.0}
+    True
+    >>> monitor.notify(8, RIDER, REQUEST, 'Rita', Location(5, 3))
+    >>> monitor.notify(12, RIDER, CANCEL, 'Rita', Location(5, 3))
+    >>> monitor.report()['rider_wait_time']
+    3.0
+    >>> [activity.description for activity in monitor.activities()][:3]
+    ['request', 'request', 'pickup']
+    >>> monitor.close()
+    """
+
+    # === Private Attributes ===
+    _connection: sqlite3.Connection
+    #     The connection to the database that holds the activities.
+    _buffer: List[Tuple[int, str, str, str, int, int]]
+    #     The activities not yet inserted into the database, in the order
+    #     notified, as (time, category, description, id, row, column).
+    _buffer_size: int
+    #     The number of activities to buffer before inserting them.
+    #
+    # === Representation Invariants ===
+    # The activities table holds the activities notified before those in
+    # _buffer, numbered in the order notified by its seq column.
+
+    def __init__(self, filename: str = "", buffer_size: int = 100000) -> None:
+        """Initialize a SpillingMonitor that keeps its activities in the
+        SQLite database <filename>.
+
+        By default, a temporary database is used, which SQLite keeps on
+        disk and deletes when the monitor is closed. An existing database
+        must not already hold activities.
+        """
+        super().__init__()
+        self._connection = sqlite3.connect(filename)
+        # The record is only of use once the run is over, so there is no
+        # need to make every insertion durable.
+        self._connection.execute("PRAGMA synchronous = OFF")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS activities ("
+            "seq INTEGER PRIMARY KEY, time INTEGER, category TEXT, "
+            "description TEXT, id TEXT, row INTEGER, col INTEGER)")
+        self._buffer = []
+        self._buffer_size = buffer_size
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        self._flush()
+        counts = dict(self._connection.execute(
+            "SELECT category, COUNT(DISTINCT id) FROM activities "
+            "GROUP BY category"))
+        return "Monitor ({} drivers, {} riders)".format(
+            counts.get(DRIVER, 0), counts.get(RIDER, 0))
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or RIDER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROP_OFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        self._buffer.append((timestamp, category, description, identifier,
+                             location.row, location.column))
+        if len(self._buffer) >= self._buffer_size:
+            self._flush()
+
+    def activities(self) -> Iterator[Activity]:
+        """Yield every activity recorded, in the order notified.
+
+        The activities are read from the database as they are yielded.
+        """
+        self._flush()
+        for timestamp, description, identifier, row, column in \
+                self._connection.execute(
+                    "SELECT time, description, id, row, col FROM activities "
+                    "ORDER BY seq"):
+            yield Activity(timestamp, description, identifier,
+                           Location(row, column))
+
+    def close(self) -> None:
+        """Insert any buffered activities, and close the database.
+
+        """
+        self._flush()
+        self._connection.close()
+
+    def _flush(self) -> None:
+        """Insert the buffered activities into the database.
+
+        """
+        if self._buffer:
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT INTO activities "
+                    "(time, category, description, id, row, col) "
+                    "VALUES (?, ?, ?, ?, ?, ?)", self._buffer)
+            self._buffer = []
+
+    def _query(self, sql: str, *parameters: object) -> Tuple:
+        """Return the single row of the query <sql> with <parameters>, after
+        inserting any buffered activities.
+
+        """
+        self._flush()
+        return self._connection.execute(sql, parameters).fetchone()
+
+    def _average_wait_time(self) -> float:
+        """Return the average wait time of riders that have either been picked
+        up or have cancelled their ride.
+
+        """
+        # The wait of a rider is from their first activity to their second.
+        # As in a Monitor, the activities of a rider after they cancel or
+        # are dropped off are those of a new rider with the same id, so the
+        # activities of each id are numbered by how many times it finished
+        # before them.
+        total, count = self._query(
+            "SELECT SUM(time - first), COUNT(*) FROM ("
+            " SELECT time,"
+            "  ROW_NUMBER() OVER riders AS n,"
+            "  FIRST_VALUE(time) OVER riders AS first"
+            " FROM (SELECT seq, time, id,"
+            "        COUNT(CASE WHEN description IN (?, ?) THEN 1 END) OVER ("
+            "         PARTITION BY id ORDER BY seq"
+            "         ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING)"
+            "        AS finished"
+            "       FROM activities WHERE category = ?)"
+            " WINDOW riders AS (PARTITION BY id, finished ORDER BY seq))"
+            "WHERE n = 2", CANCEL, DROPOFF, RIDER)
+        return (total or 0) / count
+
+    def _average_total_distance(self) -> float:
+        """Return the average distance drivers have driven.
+
+        """
+        total, count = self._query(
+            "SELECT SUM(ABS(row - last_row) + ABS(col - last_col)),"
+            " COUNT(DISTINCT id) FROM ("
+            " SELECT id, row, col,"
+            "  LAG(row) OVER drivers AS last_row,"
+            "  LAG(col) OVER drivers AS last_col"
+            " FROM activities WHERE category = ?"
+            " WINDOW drivers AS (PARTITION BY id ORDER BY seq))", DRIVER)
+        return (total or 0) / count
+
+    def _average_ride_distance(self) -> float:
+        """Return the average distance drivers have driven on rides.
+
+        """
+        # Like a Monitor, pair up the pickups and dropoffs of every driver in
+        # one sequence, ordered by when each driver was first notified
+        # about, and then by time.
+        total, = self._query(
+            "SELECT SUM(ABS(row - last_row) + ABS(col - last_col)) FROM ("
+            " SELECT row, col,"
+            "  LAG(row) OVER stops AS last_row,"
+            "  LAG(col) OVER stops AS last_col,"
+            "  ROW_NUMBER() OVER stops AS n"
+            " FROM (SELECT seq, description, row, col,"
+            "        MIN(seq) OVER (PARTITION BY id) AS first"
+            "       FROM activities WHERE category = ?)"
+            " WHERE description IN (?, ?)"
+            " WINDOW stops AS (ORDER BY first, seq))"
+            "WHERE n % 2 = 0", DRIVER, PICKUP, DROPOFF)
+        count, = self._query(
+            "SELECT COUNT(DISTINCT id) FROM activities WHERE category = ?",
+            DRIVER)
+        return (total or 0) / count
+
+
 if __name__ == "__main__":
     import python_ta
     python_ta.check_all(
         config={
             'max-args': 6,
-            'extra-imports': ['typing', 'location']})
+            'extra-imports': ['math', 'sqlite3', 'zlib', 'array', 'typing',
+                              'location', 'registry', 'sketch', 'numpy']})
@@ -0,0 +1,76 @@
+"""Registries of identifiers for the simulation"""
+
+from typing import Dict, List
+
+
+class IdRegistry:
+    """A registry that numbers identifiers densely, starting from 0.
+
+    Each identifier is given the next unused index the first time it is
+    seen, and keeps that index from then on. The registry also interns the
+    identifiers, so every object registered under the same identifier can
+    share one string.
+
+    >>> registry = IdRegistry()
+    >>> registry.index("Almond")
+    0
+    >>> registry.index("Bisque")
+    1
+    >>> registry.index("Almond")
+    0
+    >>> registry.identifier(1)
+    'Bisque'
+    >>> len(registry)
+    2
+    """
+
+    # === Private Attributes ===
+    _indexes: Dict[str, int]
+    #     A dictionary whose key is an identifier, and value is its index.
+    _identifiers: List[str]
+    #     The identifiers, in the order of their indexes.
+    #
+    # === Representation Invariants ===
+    # _indexes[_identifiers[i]] == i for every index i of _identifiers.
+
+    def __init__(self) -> None:
+        """Initialize an empty IdRegistry.
+
+        """
+        self._indexes = {}
+        self._identifiers = []
+
+    def __len__(self) -> int:
+        """Return the number of identifiers in this IdRegistry.
+
+        """
+        return len(self._indexes)
+
+    def __contains__(self, identifier: object) -> bool:
+        """Return True iff <identifier> is in this IdRegistry.
+
+        """
+        return identifier in self._indexes
+
+    def index(self, identifier: str) -> int:
+        """Return the index of <identifier>, registering it if it is new.
+
+        """
+        index = self._indexes.get(identifier)
+        if index is None:
+            index = len(self._identifiers)
+            self._indexes[identifier] = index
+            self._identifiers.append(identifier)
+        return index
+
+    def identifier(self, index: int) -> str:
+        """Return the interned identifier with <index>.
+
+        Precondition: 0 <= index < len(self).
+        """
+        return self._identifiers[index]
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['typing']})
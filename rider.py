@@ -8,6 +8,7 @@ CANCELLED: A constant used for the cancelled rider status.
 SATISFIED: A constant used for the satisfied rider status
 """
 
+import sys
 from location import Location
 
 WAITING = "waiting"
@@ -19,6 +20,12 @@ class Rider:
 
     """A rider for a ride-sharing service.
 
+    === Attributes ===
+    id: A unique identifier for the rider.
+    patience: The time the rider will wait for a driver before cancelling.
+    origin: The location the rider wants to be picked up at.
+    destination: The location the rider wants to be dropped off at.
+    status: The status (WAITING, CANCELLED or SATISFIED) of the rider.
     """
 
     id: str
@@ -32,7 +39,7 @@ class Rider:
         """Initialize a Rider.
 
         """
-        self.id = identifier
+        self.id = sys.intern(identifier)
         self.patience = patience
         self.origin = origin
         self.destination = destination
@@ -49,10 +56,22 @@ class Rider:
     def __eq__(self, other: object) -> bool:
         """Return True if self equals other, and false otherwise.
 
+        Riders are equal iff they have the same id.
+
+        >>> Rider("Almond", 10, Location(1, 1), Location(5, 5)) == \\
+        ...     Rider("Almond", 5, Location(1, 1), Location(5, 5))
+        True
+        """
+        return self is other or (isinstance(other, Rider)
+                                 and self.id == other.id)
+
+    def __hash__(self) -> int:
+        """Return a hash of this rider, which depends only on its id.
+
         """
-        return self.__str__() == other.__str__()
+        return hash(self.id)
 
 
 if __name__ == '__main__':
     import python_ta
-    python_ta.check_all(config={'extra-imports': ['location']})
+    python_ta.check_all(config={'extra-imports': ['sys', 'location']})
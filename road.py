@@ -0,0 +1,508 @@
+"""Road graphs for the simulation
+
+A road graph is read from an edge-list file, with one road per line: the
+locations at its two ends, and its length. For example:
+
+    # row,column row,column length
+    1,1 1,5 4
+    1,5 3,5 3
+
+Roads can be driven both ways. Blank lines and lines that start with # are
+skipped. No road may be shorter than the Manhattan distance between its
+ends, so that no route is shorter than the Manhattan distance, as
+travel-time oracles must not be. A location that is not on the graph is
+joined to the nearest location that is, along rows and columns.
+
+Distances are found from tables computed up front. A graph of up to
+TABLE_LIMIT locations gets a table of the distances between every two of
+them, which can be saved to a table file and memory-mapped from it later.
+A larger graph gets the distances from LANDMARKS landmark locations to all
+the others, and is searched with A*, using the landmarks and the triangle
+inequality to bound the distance left (ALT).
+
+A table file is laid out as:
+
+    header      magic, format version, number of locations and a digest of
+                the graph, as HEADER
+    distances   the distance from each location to each other, row by row,
+                as little-endian 64-bit integers, starting on a multiple of
+                8 bytes
+
+=== Constants ===
+TABLE_LIMIT: The largest number of locations a graph gets a table for.
+LANDMARKS: The number of landmarks a larger graph gets.
+MAGIC: The bytes that every table file starts with.
+FORMAT_VERSION: The version of the format of table files.
+HEADER: The layout of the header of a table file.
+"""
+
+import hashlib
+import heapq
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+from location import INTERN_LIMIT, Location, deserialize_location, \
+    intern_location, manhattan_distance
+from spatial import GridIndex
+from travel import TravelOracle, divide_rounded
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TABLE_LIMIT = 2048
+LANDMARKS = 16
+MAGIC = b"UBERROAD"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sII32s")
+
+
+class RoadGraph:
+    """A graph of the roads between locations.
+
+    >>> graph = RoadGraph([(Location(1, 1), Location(1, 5), 4),
+    ...                    (Location(1, 5), Location(3, 5), 3),
+    ...                    (Location(1, 1), Location(3, 5), 9)])
+    >>> graph.prepare()
+    >>> graph.distance(Location(1, 1), Location(3, 5))
+    7
+    >>> graph.distance(Location(3, 1), Location(3, 5))
+    9
+
+    === Attributes ===
+    locations: The location of each node of the graph, by node number.
+    """
+
+    locations: List[Location]
+
+    # === Private Attributes ===
+    _nodes: Dict[Location, int]
+    #     The number of the node at each location of the graph.
+    _roads: List[List[Tuple[int, int]]]
+    #     The roads from each node, as (node, length) pairs.
+    _grid: GridIndex
+    #     The node numbers, indexed by location.
+    _joins: Dict[Location, Tuple[int, int]]
+    #     The nearest node to each location looked up so far, and the
+    #     Manhattan distance to it.
+    _digest: bytes
+    #     A hash of the locations and roads of the graph.
+    _table: Optional[Sequence[int]]
+    #     The distance from node i to node j at index i * len(locations) + j,
+    #     if the graph has a table, and None otherwise.
+    _landmarks: List[Sequence[int]]
+    #     The distances from each landmark to every node, if the graph has
+    #     no table.
+    _views: List[memoryview]
+    #     The views of the mapped table file, if the table is mapped.
+    _map: Optional[mmap.mmap]
+    #     The mapped table file, if the table is mapped.
+    #
+    # === Representation Invariants ===
+    # _nodes[locations[i]] == i for every node i.
+    # Once the graph is prepared, either _table or _landmarks is not empty.
+
+    def __init__(self, roads: Iterable[Tuple[Location, Location, int]]) \
+            -> None:
+        """Initialize a RoadGraph of <roads>, given as (end, end, length)
+        tuples.
+
+        The graph must be prepared before distances are found in it. Raise
+        a ValueError if there are no roads, a road is shorter than the
+        Manhattan distance between its ends, or the roads are not all
+        connected.
+        """
+        self.locations = []
+        self._nodes = {}
+        self._roads = []
+        self._grid = GridIndex(16)
+        self._joins = {}
+        self._table = None
+        self._landmarks = []
+        self._views = []
+        self._map = None
+        numbers = array("q")
+        for first, second, length in roads:
+            if length < manhattan_distance(first, second):
+                raise ValueError("road from {} to {} is shorter than the "
+                                 "Manhattan distance".format(first, second))
+            ends = (self._add_node(first), self._add_node(second))
+            self._roads[ends[0]].append((ends[1], length))
+            self._roads[ends[1]].append((ends[0], length))
+            numbers.extend(ends + (length,))
+        if not self.locations:
+            raise ValueError("road graph has no roads")
+        if math.inf in self._shortest_paths(0):
+            raise ValueError("road graph is not connected")
+
+        for location in self.locations:
+            numbers.extend((location.row, location.column))
+        self._digest = hashlib.sha256(numbers.tobytes()).digest()
+
+    def __len__(self) -> int:
+        """Return the number of locations on this graph.
+
+        """
+        return len(self.locations)
+
+    def prepare(self, table_file: Optional[str] = None) -> None:
+        """Compute the tables that distances are found from.
+
+        If this graph gets a table of all distances, and <table_file> is
+        given, the table is mapped from <table_file> if it holds the table
+        of this graph, and otherwise computed and saved to it first.
+        """
+        count = len(self.locations)
+        if count > TABLE_LIMIT:
+            self._landmarks = []
+            closest = [math.inf] * count
+            landmark = 0
+            for _ in range(min(LANDMARKS, count)):
+                distances = array("q", self._shortest_paths(landmark))
+                self._landmarks.append(distances)
+                # The next landmark is the node farthest from all of them.
+                closest = [min(a, b) for a, b in zip(closest, distances)]
+                landmark = max(range(count), key=closest.__getitem__)
+            return
+
+        if table_file is not None and self._map_table(table_file):
+            return
+        table = array("q")
+        for node in range(count):
+            table.extend(self._shortest_paths(node))
+        if table_file is None:
+            self._table = table
+            return
+        directory = os.path.dirname(os.path.abspath(table_file))
+        descriptor, temporary = tempfile.mkstemp(dir=directory)
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(HEADER.pack(MAGIC, FORMAT_VERSION, count,
+                                   self._digest))
+            file.write(bytes(_align(HEADER.size) - HEADER.size))
+            if sys.byteorder != "little":
+                table.byteswap()
+            table.tofile(file)
+        os.replace(temporary, table_file)
+        self._map_table(table_file)
+
+    def close(self) -> None:
+        """Unmap the table file, if the table is mapped from one.
+
+        The graph must be prepared again before distances are found in it.
+        """
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._table = None
+
+    def distance(self, origin: Location, destination: Location) -> int:
+        """Return the length of the shortest route between the origin and
+        the destination.
+
+        """
+        if origin == destination:
+            return 0
+        source, to_source = self._join(origin)
+        target, to_target = self._join(destination)
+        return to_source + self._node_distance(source, target) + to_target
+
+    def distances(self, rows: Sequence[int], columns: Sequence[int],
+                  to_rows: Sequence[int],
+                  to_columns: Sequence[int]) -> object:
+        """Return the lengths of the shortest routes from each of the N
+        locations at <rows> and <columns> to each of the M locations at
+        <to_rows> and <to_columns>, as an N by M matrix.
+
+        The matrix is as for location.manhattan_distances. If the graph has
+        a table and numpy is installed, it is looked up in one vectorized
+        operation. If the graph has no table, one search is made from each
+        node joined to the locations on the shorter side of the matrix,
+        rather than one for every pair.
+        """
+        origins = [self._join(intern_location(row, column))
+                   for row, column in zip(rows, columns)]
+        destinations = [self._join(intern_location(row, column))
+                        for row, column in zip(to_rows, to_columns)]
+        count = len(self.locations)
+        if numpy is not None and self._table is not None:
+            table = numpy.frombuffer(self._table, dtype="<i8").reshape(
+                count, count)
+            sources, to_sources = numpy.array(
+                origins, dtype=numpy.int64).reshape(-1, 2).T
+            targets, to_targets = numpy.array(
+                destinations, dtype=numpy.int64).reshape(-1, 2).T
+            matrix = (table[sources[:, None], targets[None, :]]
+                      + to_sources[:, None] + to_targets[None, :])
+            same = ((numpy.asarray(rows)[:, None] == numpy.asarray(to_rows))
+                    & (numpy.asarray(columns)[:, None]
+                       == numpy.asarray(to_columns)))
+            matrix[same] = 0
+            return matrix
+
+        if self._table is not None:
+            table = self._table
+            between = {(source, target): table[source * count + target]
+                       for source, _ in origins
+                       for target, _ in destinations}
+        else:
+            # Roads can be driven both ways, so the distances from the
+            # targets are the distances to them.
+            reverse = len(destinations) < len(origins)
+            sources = {node for node, _ in
+                       (destinations if reverse else origins)}
+            targets = {node for node, _ in
+                       (origins if reverse else destinations)}
+            between = {}
+            for source in sources:
+                for target, distance in self._settle(source,
+                                                     targets).items():
+                    if reverse:
+                        between[(target, source)] = distance
+                    else:
+                        between[(source, target)] = distance
+        matrix = [[0 if row == to_row and column == to_column else
+                   to_source + between[(source, target)] + to_target
+                   for to_row, to_column, (target, to_target)
+                   in zip(to_rows, to_columns, destinations)]
+                  for row, column, (source, to_source)
+                  in zip(rows, columns, origins)]
+        if numpy is None:
+            return matrix
+        return numpy.array(matrix, dtype=numpy.int64).reshape(
+            len(origins), len(destinations))
+
+    def _add_node(self, location: Location) -> int:
+        """Return the number of the node at <location>, adding it if it is
+        not on the graph yet.
+
+        """
+        node = self._nodes.get(location)
+        if node is None:
+            node = len(self.locations)
+            self.locations.append(location)
+            self._nodes[location] = node
+            self._roads.append([])
+            self._grid.add(node, location, node)
+        return node
+
+    def _join(self, location: Location) -> Tuple[int, int]:
+        """Return the nearest node to <location>, and the Manhattan distance
+        to it.
+
+        Of equally near nodes, the one with the lowest number is returned.
+        """
+        joined = self._joins.get(location)
+        if joined is None:
+            node = self._nodes.get(location)
+            if node is None:
+                node = self._grid.nearest(
+                    location,
+                    lambda other: (manhattan_distance(
+                        location, self.locations[other]), other),
+                    lambda distance: (distance, -1))
+            joined = (node,
+                      manhattan_distance(location, self.locations[node]))
+            if len(self._joins) < INTERN_LIMIT:
+                self._joins[location] = joined
+        return joined
+
+    def _node_distance(self, source: int, target: int) -> int:
+        """Return the length of the shortest route between the nodes
+        <source> and <target>.
+
+        """
+        if self._table is not None:
+            return self._table[source * len(self.locations) + target]
+        if source == target:
+            return 0
+
+        # A* search, bounding the distance left from each node by the
+        # triangle inequality with each landmark, and by the Manhattan
+        # distance.
+        landmarks = self._landmarks
+        goal = self.locations[target]
+        locations = self.locations
+
+        def bound(node: int) -> int:
+            return max(max(abs(distances[target] - distances[node])
+                           for distances in landmarks),
+                       manhattan_distance(locations[node], goal))
+
+        best = {source: 0}
+        queue = [(bound(source), 0, source)]
+        while queue:
+            _, distance, node = heapq.heappop(queue)
+            if node == target:
+                return distance
+            if distance > best[node]:
+                continue
+            for other, length in self._roads[node]:
+                other_distance = distance + length
+                if other_distance < best.get(other, math.inf):
+                    best[other] = other_distance
+                    heapq.heappush(queue, (other_distance + bound(other),
+                                           other_distance, other))
+        raise ValueError("no route between nodes {} and {}".format(source,
+                                                                   target))
+
+    def _settle(self, source: int, targets: Set[int]) -> Dict[int, int]:
+        """Return the length of the shortest route from the node <source>
+        to each of the nodes <targets>, searching only until all of them
+        have been reached.
+
+        """
+        distances = {source: 0}
+        settled = {}
+        queue = [(0, source)]
+        while queue and len(settled) < len(targets):
+            distance, node = heapq.heappop(queue)
+            if distance > distances[node]:
+                continue
+            if node in targets:
+                settled[node] = distance
+            for other, length in self._roads[node]:
+                other_distance = distance + length
+                if other_distance < distances.get(other, math.inf):
+                    distances[other] = other_distance
+                    heapq.heappush(queue, (other_distance, other))
+        return settled
+
+    def _shortest_paths(self, source: int) -> List[float]:
+        """Return the length of the shortest route from the node <source> to
+        each node, or math.inf for nodes that cannot be reached.
+
+        """
+        distances = [math.inf] * len(self.locations)
+        distances[source] = 0
+        queue = [(0, source)]
+        while queue:
+            distance, node = heapq.heappop(queue)
+            if distance > distances[node]:
+                continue
+            for other, length in self._roads[node]:
+                other_distance = distance + length
+                if other_distance < distances[other]:
+                    distances[other] = other_distance
+                    heapq.heappush(queue, (other_distance, other))
+        return distances
+
+    def _map_table(self, table_file: str) -> bool:
+        """Map the table of this graph from <table_file>, and return True,
+        or return False if <table_file> does not hold the table of this
+        graph.
+
+        """
+        self.close()
+        count = len(self.locations)
+        size = _align(HEADER.size) + count * count * 8
+        try:
+            with open(table_file, "rb") as file:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        if len(data) != size or HEADER.unpack_from(data) != (
+                MAGIC, FORMAT_VERSION, count, self._digest):
+            data.close()
+            return False
+
+        whole = memoryview(data)
+        raw = whole[_align(HEADER.size):]
+        self._views = [whole, raw]
+        if sys.byteorder == "little":
+            self._table = raw.cast("q")
+            self._views.append(self._table)
+        else:
+            self._table = array("q", raw.tobytes())
+            self._table.byteswap()
+        self._map = data
+        return True
+
+
+class RoadOracle(TravelOracle):
+    """An oracle for travel along the roads of a road graph, which takes
+    the length of the shortest route divided by the speed.
+
+    >>> graph = RoadGraph([(Location(1, 1), Location(1, 5), 4),
+    ...                    (Location(1, 5), Location(3, 5), 3)])
+    >>> graph.prepare()
+    >>> RoadOracle(graph).travel_time(Location(1, 1), Location(3, 5), 2)
+    4
+
+    === Attributes ===
+    graph: The prepared road graph.
+    """
+
+    graph: RoadGraph
+
+    def __init__(self, graph: RoadGraph) -> None:
+        """Initialize a RoadOracle for travel on <graph>.
+
+        Precondition: graph has been prepared.
+        """
+        self.graph = graph
+
+    def travel_time(self, origin: Location, destination: Location,
+                    speed: int) -> int:
+        """Return the time it takes to travel from <origin> to
+        <destination> at <speed>, rounded to the nearest integer.
+
+        """
+        return round(self.graph.distance(origin, destination) / speed)
+
+    def travel_times(self, rows: Sequence[int], columns: Sequence[int],
+                     speeds: Sequence[int], to_rows: Sequence[int],
+                     to_columns: Sequence[int]) -> object:
+        """Return the times it takes to travel from each of N locations to
+        each of M locations, as an N by M matrix, where the arguments and
+        matrix are as for TravelOracle.travel_times.
+
+        """
+        distances = self.graph.distances(rows, columns, to_rows, to_columns)
+        return divide_rounded(distances, speeds)
+
+
+def read_graph(filename: str, table_file: Optional[str] = None) \
+        -> RoadGraph:
+    """Return the prepared road graph of the roads in the edge-list file
+    <filename>.
+
+    table_file is as for RoadGraph.prepare.
+    """
+    roads = []
+    with open(filename) as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                first, second, length = line.split()
+                roads.append((deserialize_location(first),
+                              deserialize_location(second), int(length)))
+    graph = RoadGraph(roads)
+    graph.prepare(table_file)
+    return graph
+
+
+def _align(position: int) -> int:
+    """Return the first multiple of 8 that is not less than <position>.
+
+    """
+    return (position + 7) // 8 * 8
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['read_graph', 'RoadGraph.prepare',
+                           'RoadGraph._map_table'],
+            'extra-imports': ['hashlib', 'heapq', 'math', 'mmap', 'os',
+                              'struct', 'sys', 'tempfile', 'array', 'typing',
+                              'location', 'spatial', 'travel', 'numpy']})
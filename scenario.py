@@ -0,0 +1,312 @@
+"""Binary scenario files for the simulation
+
+A scenario file holds the same events as an event file, in a compact binary
+form that can be read without parsing any text. It is laid out in columns:
+
+    header      magic, format version, number of events, number of ids and
+                the size of the id strings, as HEADER
+    columns     one array per field of a record, in the order of COLUMNS,
+                each starting on a multiple of 8 bytes
+    ids         the offset of each id string in the string data (one more
+                offset than there are ids), as 64-bit integers
+    strings     the id strings, in UTF-8, one after the other
+
+All numbers are little-endian. The id column holds, for each event, the
+index of its id among the id strings.
+
+=== Constants ===
+MAGIC: The bytes that every scenario file starts with.
+FORMAT_VERSION: The version of the format written by write_scenario.
+HEADER: The layout of the header of a scenario file.
+COLUMNS: The name and array typecode of each column, in file order.
+CACHE_SIZE: The default number of bytes a ScenarioCache may use.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Dict, Iterable, Iterator, List, Tuple
+from event import Event, Record, DRIVER_REQUEST, RIDER_REQUEST, \
+    PARSER_VERSION, make_event, open_event_file, parse_record
+from registry import IdRegistry
+
+MAGIC = b"UBERSIM\0"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIQQQ")
+COLUMNS = (("timestamp", "q"), ("row", "i"), ("column", "i"),
+           ("to_row", "i"), ("to_column", "i"), ("number", "i"),
+           ("id", "I"), ("type", "B"))
+CACHE_SIZE = 1 << 30
+
+# The code stored in the type column for each event type, and back.
+_TYPE_CODES = {DRIVER_REQUEST: 0, RIDER_REQUEST: 1}
+_TYPE_NAMES = (DRIVER_REQUEST, RIDER_REQUEST)
+
+
+class ScenarioCache:
+    """An on-disk cache of event files, converted to scenario files.
+
+    Each event file is cached under a hash of its contents, the parser
+    version and the scenario format version, so a cached scenario is used
+    only if it holds exactly what parsing the event file now would give.
+    Changing the file, the parser or the format leaves the old entry
+    unused, to be evicted in time. When the cache grows past its size, the
+    entries used least recently are evicted first.
+
+    === Attributes ===
+    directory: The directory that holds the cached scenario files.
+    max_bytes: The most bytes the cached scenario files may use together.
+    """
+
+    directory: str
+    max_bytes: int
+
+    def __init__(self, directory: str, max_bytes: int = CACHE_SIZE) -> None:
+        """Initialize a ScenarioCache in <directory>, creating it if it does
+        not exist.
+
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self, filename: str) -> Iterator[Event]:
+        """Yield the events in the event file <filename> one at a time,
+        from its cached scenario file.
+
+        The event file is converted and cached first if it is not already.
+        """
+        return iter_scenario(self.path(filename))
+
+    def path(self, filename: str) -> str:
+        """Return the name of the cached scenario file for the event file
+        <filename>, converting it first if it is not cached.
+
+        """
+        digest = hashlib.sha256(
+            "{} {}\n".format(PARSER_VERSION, FORMAT_VERSION).encode())
+        with open(filename, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                digest.update(block)
+        path = os.path.join(self.directory, digest.hexdigest() + ".scenario")
+        try:
+            # Mark the entry as the most recently used.
+            os.utime(path)
+        except FileNotFoundError:
+            # Convert to a temporary file first, so that no other reader
+            # ever sees a partly written entry.
+            handle, temporary = tempfile.mkstemp(dir=self.directory,
+                                                 suffix=".tmp")
+            os.close(handle)
+            try:
+                convert_events(filename, temporary)
+                os.replace(temporary, path)
+            except BaseException:
+                os.remove(temporary)
+                raise
+            self._evict(path)
+        return path
+
+    def clear(self) -> None:
+        """Remove every cached scenario file.
+
+        """
+        for name in os.listdir(self.directory):
+            if name.endswith(".scenario"):
+                os.remove(os.path.join(self.directory, name))
+
+    def _evict(self, keep: str) -> None:
+        """Remove the least recently used cached scenario files, other than
+        <keep>, until they use no more than max_bytes together.
+
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".scenario"):
+                status = entry.stat()
+                entries.append((status.st_mtime_ns, entry.path,
+                                status.st_size))
+                total += status.st_size
+        entries.sort()
+        for _, path, size in entries:
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+def convert_events(source: str, destination: str) -> int:
+    """Convert the event file <source> to a scenario file <destination>, and
+    return the number of events written.
+
+    The event file may be compressed, as for iter_events. No drivers or
+    riders are created.
+    """
+    with open_event_file(source) as file:
+        return write_scenario(filter(None, map(parse_record, file)),
+                              destination)
+
+
+def write_scenario(records: Iterable[Record], filename: str) -> int:
+    """Write the events with <records> to a scenario file named <filename>,
+    and return the number of events written.
+
+    """
+    columns = {name: array(code) for name, code in COLUMNS}
+    ids = IdRegistry()
+    for timestamp, event_type, identifier, row, column, to_row, to_column, \
+            number in records:
+        columns["timestamp"].append(timestamp)
+        columns["type"].append(_TYPE_CODES[event_type])
+        columns["id"].append(ids.index(identifier))
+        columns["row"].append(row)
+        columns["column"].append(column)
+        columns["to_row"].append(to_row)
+        columns["to_column"].append(to_column)
+        columns["number"].append(number)
+
+    strings = [ids.identifier(i).encode("utf-8") for i in range(len(ids))]
+    offsets = array("Q", [0])
+    for string in strings:
+        offsets.append(offsets[-1] + len(string))
+    count = len(columns["timestamp"])
+
+    with open(filename, "wb") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, count, len(ids),
+                               offsets[-1]))
+        for name, _ in COLUMNS:
+            _write_aligned(file, columns[name])
+        _write_aligned(file, offsets)
+        file.write(b"".join(strings))
+    return count
+
+
+def iter_scenario(filename: str) -> Iterator[Event]:
+    """Yield the events in the scenario file <filename> one at a time.
+
+    The file is memory-mapped, and each event is built from the columns
+    only when it is reached, so the file is never read into memory as a
+    whole.
+    """
+    for record in iter_records(filename):
+        yield make_event(record)
+
+
+def iter_records(filename: str) -> Iterator[Record]:
+    """Yield the records of the events in the scenario file <filename> one
+    at a time.
+
+    Raise a ValueError if <filename> is not a complete scenario file of this
+    format version.
+    """
+    with open(filename, "rb") as file, \
+            mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        views = []
+        try:
+            count, columns, offsets, strings = _map_columns(data, views)
+            timestamps, rows, column_values, to_rows, to_columns, numbers, \
+                id_indexes, types = [columns[name] for name, _ in COLUMNS]
+            for i in range(count):
+                index = id_indexes[i]
+                identifier = str(strings[offsets[index]:offsets[index + 1]],
+                                 "utf-8")
+                yield (timestamps[i], _TYPE_NAMES[types[i]], identifier,
+                       rows[i], column_values[i], to_rows[i], to_columns[i],
+                       numbers[i])
+        finally:
+            # The map cannot be closed while any view of it is alive.
+            for view in reversed(views):
+                view.release()
+
+
+def _map_columns(data: mmap.mmap, views: List[memoryview]) \
+        -> Tuple[int, Dict[str, object], object, memoryview]:
+    """Return the number of events, the columns, the id string offsets and
+    the id string data of the scenario file mapped at <data>.
+
+    Every memoryview made of <data> is appended to <views>, so the caller
+    can release them. On little-endian machines the columns are views of
+    <data>, with nothing copied; on other machines they are byte-swapped
+    copies.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("not a scenario file")
+    magic, version, _, count, id_count, string_size = \
+        HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a scenario file")
+    if version != FORMAT_VERSION:
+        raise ValueError("unsupported scenario format version {}".format(
+            version))
+
+    whole = memoryview(data)
+    views.append(whole)
+    position = HEADER.size
+    columns = {}
+    for name, code in COLUMNS + (("offsets", "Q"),):
+        length = id_count + 1 if name == "offsets" else count
+        position = _align(position)
+        size = length * array(code).itemsize
+        if position + size > len(data):
+            raise ValueError("scenario file is truncated")
+        columns[name] = _column(whole[position:position + size], code, views)
+        position += size
+    if position + string_size > len(data):
+        raise ValueError("scenario file is truncated")
+    strings = whole[position:position + string_size]
+    views.append(strings)
+    offsets = columns.pop("offsets")
+    return count, columns, offsets, strings
+
+
+def _column(raw: memoryview, code: str, views: List[memoryview]) -> object:
+    """Return the little-endian array of typecode <code> held in <raw>.
+
+    """
+    views.append(raw)
+    if sys.byteorder == "little":
+        column = raw.cast(code)
+        views.append(column)
+        return column
+    column = array(code, raw.tobytes())
+    column.byteswap()
+    return column
+
+
+def _write_aligned(file: object, column: array) -> None:
+    """Write <column> to <file> in little-endian order, after enough zero
+    bytes to start it on a multiple of 8 bytes.
+
+    """
+    file.write(bytes(_align(file.tell()) - file.tell()))
+    if sys.byteorder != "little":
+        column = array(column.typecode, column)
+        column.byteswap()
+    column.tofile(file)
+
+
+def _align(position: int) -> int:
+    """Return the first multiple of 8 that is not less than <position>.
+
+    """
+    return (position + 7) & ~7
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(
+        config={
+            'allowed-io': ['ScenarioCache.path', 'write_scenario',
+                           'iter_records'],
+            'extra-imports': ['hashlib', 'mmap', 'os', 'struct', 'sys',
+                              'tempfile', 'array', 'typing', 'event',
+                              'registry']})
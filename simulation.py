@@ -1,10 +1,14 @@
 """Starting point for simulation"""
 
-from typing import List, Dict
-from container import PriorityQueue
-from dispatcher import Dispatcher
+from operator import attrgetter, methodcaller
+from typing import Dict, Iterable, Iterator, Optional
+from bus import ActivityBus
+from container import Container, PriorityQueue, BucketQueue
+from dispatcher import BatchDispatcher, Dispatcher
+from driver import Driver
 from event import Event, create_event_list
 from monitor import Monitor
+from travel import TravelOracle
 
 
 class Simulation:
@@ -26,54 +30,215 @@ class Simulation:
     """
 
     # === Private Attributes ===
-    _events: PriorityQueue
+    _events: Container
     #     A sequence of events arranged in priority determined by the event
-    #     sorting order.
+    #     sorting order. If it is a BucketQueue, the events are done one
+    #     whole timestamp at a time.
     _dispatcher: Dispatcher
     #     The dispatcher associated with the simulation.
     _monitor: Monitor
     #     The monitor associated with the simulation.
-
-    def __init__(self) -> None:
+    _bus: ActivityBus
+    #     The bus that the events publish their activities to.
+    _instrument: bool
+    #     True if the monitor is subscribed to the bus.
+    _oracle: Optional[TravelOracle]
+    #     The travel-time oracle that drivers use while this simulation
+    #     runs, or None to leave Driver.oracle as it is.
+    _merge_initial: bool
+    #     True if the initial events are merged into the event queue in
+    #     timestamp order, and False if each initial event is done, along
+    #     with every event it spawns, before the next one is added.
+    _compact_at: int
+    #     The size the event queue must reach before void events are next
+    #     purged from it.
+
+    # The least size the event queue must reach before it is compacted.
+    _MIN_COMPACT_AT = 1024
+
+    def __init__(self, events: Optional[Container] = None,
+                 merge_initial: bool = False,
+                 dispatcher: Optional[Dispatcher] = None,
+                 monitor: Optional[Monitor] = None,
+                 bus: Optional[ActivityBus] = None,
+                 instrument: bool = True,
+                 oracle: Optional[TravelOracle] = None) -> None:
         """Initialize a Simulation.
 
+        events: An empty queue to schedule events in, which must order
+            events by timestamp, e.g. BucketQueue(key=attrgetter('timestamp')).
+            By default, a PriorityQueue is used.
+        merge_initial: If True, run() does every event in timestamp order,
+            taking the initial events from their list as a stream rather than
+            adding them to the event queue.
+        dispatcher: The dispatcher to use, e.g. Dispatcher(rider_policy=
+            NEAREST). By default, a new Dispatcher is used.
+        monitor: The monitor to use, e.g. StreamingMonitor(). By default, a
+            new Monitor is used.
+        bus: The bus to publish activities to, which other sinks, such as
+            exporters, may be subscribed to. By default, a new ActivityBus
+            is used.
+        instrument: If False, the monitor is not subscribed to the bus, and
+            run() returns an empty report. With no other sinks, activities
+            are then not recorded at all.
+        oracle: The travel-time oracle for drivers to use, e.g. a
+            RoadOracle. It replaces Driver.oracle only while run() runs, so
+            it does not leak into other simulations. By default,
+            Driver.oracle is used.
+
+        Raise a ValueError if the dispatcher is a BatchDispatcher and
+        merge_initial is False: batches are scheduled in timestamp order,
+        which only merging the initial events keeps to.
+
+        >>> Simulation(dispatcher=BatchDispatcher())
+        Traceback (most recent call last):
+        ...
+        ValueError: a BatchDispatcher needs merge_initial=True
         """
-        self._events = PriorityQueue()
-        self._dispatcher = Dispatcher()
-        self._monitor = Monitor()
-
-    def run(self, initial_events: List[Event]) -> Dict[str, float]:
+        if isinstance(dispatcher, BatchDispatcher) and not merge_initial:
+            raise ValueError("a BatchDispatcher needs merge_initial=True")
+        if events is None:
+            # Events are ordered by timestamp alone, so the queue compares
+            # the timestamps directly instead of calling the Event
+            # comparisons.
+            events = PriorityQueue(key=attrgetter('timestamp'))
+        self._events = events
+        if dispatcher is None:
+            dispatcher = Dispatcher()
+        self._dispatcher = dispatcher
+        if monitor is None:
+            monitor = Monitor()
+        self._monitor = monitor
+        if bus is None:
+            bus = ActivityBus()
+        self._bus = bus
+        self._instrument = instrument
+        if instrument:
+            bus.subscribe(monitor.notify)
+        self._oracle = oracle
+        self._merge_initial = merge_initial
+        self._compact_at = self._MIN_COMPACT_AT
+
+    def run(self, initial_events: Iterable[Event]) -> Dict[str, float]:
         """Run the simulation on the list of events in <initial_events>.
 
         Return a dictionary containing statistics of the simulation,
         according to the specifications in the assignment handout.
 
-        initial_events: An initial list of events.
+        initial_events: An initial list of events. Any iterable of events,
+            such as the generator returned by iter_events(), may be used
+            instead, and is consumed as the simulation runs.
         """
 
-        # Add all initial events to the event queue.
+        oracle = Driver.oracle
+        if self._oracle is not None:
+            Driver.oracle = self._oracle
+        try:
+            self._run(initial_events)
+        finally:
+            Driver.oracle = oracle
 
-        for eve in initial_events:
-            self._events.add(eve)
-            while not self._events.is_empty():
-                removed = self._events.remove()
-                stored = removed.do(self._dispatcher, self._monitor)
-                for event in stored:
+        if not self._instrument:
+            return {}
+        return self._monitor.report()
+
+    def _run(self, initial_events: Iterable[Event]) -> None:
+        """Do the events in <initial_events>, and every event they spawn.
+
+        """
+        if self._merge_initial:
+            # Merge the initial events with the queue of spawned events, as
+            # if they had all been added to the queue up front: an initial
+            # event is done after every queued event with an earlier
+            # timestamp, and before the queued events with the same one.
+            for eve in self._in_order(initial_events):
+                self._process_events(eve.timestamp)
+                for event in eve.do(self._dispatcher, self._bus):
                     self._events.add(event)
+            self._process_events()
+        else:
+            for eve in initial_events:
+                self._events.add(eve)
+                self._process_events()
 
-        # Until there are no more events, remove an event
-        # from the event queue and do it. Add any returned
-        # events to the event queue.
+    @staticmethod
+    def _in_order(initial_events: Iterable[Event]) -> Iterator[Event]:
+        """Return an iterator over <initial_events> in timestamp order.
 
-        return self._monitor.report()
+        A list is checked once, and sorted (stably) only if it is out of
+        order. Any other iterable is consumed lazily, and checked as it goes.
+
+        Raise a ValueError if an iterable that is not a list is out of order.
+        """
+        if isinstance(initial_events, list):
+            for i in range(len(initial_events) - 1):
+                if initial_events[i].timestamp > \
+                        initial_events[i + 1].timestamp:
+                    return iter(sorted(initial_events,
+                                       key=attrgetter('timestamp')))
+            return iter(initial_events)
+        return Simulation._checked_order(initial_events)
+
+    @staticmethod
+    def _checked_order(initial_events: Iterable[Event]) -> Iterator[Event]:
+        """Yield the events in <initial_events>, raising a ValueError as soon
+        as one has an earlier timestamp than the event before it.
+
+        """
+        last = None
+        for eve in initial_events:
+            if last is not None and eve.timestamp < last:
+                raise ValueError(
+                    "initial events are not in timestamp order: {} after {}"
+                    .format(eve.timestamp, last))
+            last = eve.timestamp
+            yield eve
+
+    def _process_events(self, until: Optional[int] = None) -> None:
+        """Until there are no more events, or the next event is not earlier
+        than <until>, remove an event from the event queue and do it. Add
+        any returned events to the event queue.
+
+        """
+        events = self._events
+        if isinstance(events, BucketQueue):
+            # Take every event of the earliest timestamp in one batch. Events
+            # they spawn for the same timestamp land in a new bucket, which
+            # is exactly where a PriorityQueue would have put them.
+            while not events.is_empty() and \
+                    (until is None or events.peek().timestamp < until):
+                for removed in events.remove_bucket():
+                    for event in removed.do(self._dispatcher, self._bus):
+                        events.add(event)
+                if len(events) >= self._compact_at:
+                    self._compact()
+        else:
+            while not events.is_empty() and \
+                    (until is None or events.peek().timestamp < until):
+                removed = events.remove()
+                for event in removed.do(self._dispatcher, self._bus):
+                    events.add(event)
+                if len(events) >= self._compact_at:
+                    self._compact()
+
+    def _compact(self) -> None:
+        """Purge the void events, such as cancellations of riders who have
+        already been picked up, from the event queue.
+
+        The queue is not compacted again until it has doubled in size, so
+        compaction takes amortized O(1) time per event.
+        """
+        self._events.purge(methodcaller('is_void'))
+        self._compact_at = max(self._MIN_COMPACT_AT, 2 * len(self._events))
 
 
 if __name__ == "__main__":
     import python_ta
     python_ta.check_all(
         config={
-            'extra-imports': ['typing', 'container', 'dispatcher', 'event',
-                              'monitor']})
+            'extra-imports': ['operator', 'typing', 'bus', 'container',
+                              'dispatcher', 'driver', 'event', 'monitor',
+                              'travel']})
 
     events = create_event_list("events.txt")
     sim = Simulation()
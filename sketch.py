@@ -0,0 +1,178 @@
+"""Quantile sketches for the simulation"""
+
+import math
+import random
+from typing import List
+
+
+class KLLSketch:
+    """A sketch of a stream of numbers, from which quantiles of the stream
+    can be estimated in bounded memory.
+
+    This is the sketch of Karnin, Lang and Liberty. The numbers are kept in
+    a stack of compactors, where each number at level h stands for 2 ** h
+    numbers of the stream. When a compactor fills up, it is sorted and
+    every other number in it is promoted to the level above, starting from
+    a random one of the first two. The sketch keeps O(k) numbers, and the
+    rank of any number is off by about 1.7 / k of the stream length, with
+    high probability. Until the first compaction, quantiles are exact.
+
+    Two sketches with the same k can be merged into one that sketches both
+    streams.
+
+    >>> sketch = KLLSketch()
+    >>> for value in [5, 1, 4, 2, 3]:
+    ...     sketch.add(value)
+    >>> len(sketch)
+    5
+    >>> sketch.quantile(0.5)
+    3
+    >>> sketch.quantile(1.0)
+    5
+
+    === Attributes ===
+    k: The accuracy parameter: the capacity of the top compactor.
+    """
+
+    k: int
+
+    # === Private Attributes ===
+    _compactors: List[List[float]]
+    #     The numbers at each level, from level 0 up.
+    _count: int
+    #     The number of numbers added to the stream so far.
+    _size: int
+    #     The number of numbers held in all the compactors.
+    _max_size: int
+    #     The number of numbers the compactors can hold before they must be
+    #     compacted.
+    _random: random.Random
+    #     The source of the random choices made when compacting.
+    #
+    # === Representation Invariants ===
+    # _size == sum(len(compactor) for compactor in _compactors)
+    # _count == sum(len(_compactors[h]) * 2 ** h for every level h)
+
+    # The ratio of the capacity of each compactor to the one above it.
+    _RATIO = 2 / 3
+
+    def __init__(self, k: int = 200, seed: int = 0) -> None:
+        """Initialize an empty KLLSketch with accuracy parameter <k>, making
+        its random choices from a generator seeded with <seed>.
+
+        Precondition: k >= 2.
+        """
+        self.k = k
+        self._compactors = [[]]
+        self._count = 0
+        self._size = 0
+        self._max_size = self._capacity(0)
+        self._random = random.Random(seed)
+
+    def __len__(self) -> int:
+        """Return the number of numbers added to the stream.
+
+        """
+        return self._count
+
+    def add(self, value: float) -> None:
+        """Add <value> to the stream.
+
+        """
+        self._compactors[0].append(value)
+        self._count += 1
+        self._size += 1
+        if self._size >= self._max_size:
+            self._compress()
+
+    def merge(self, other: 'KLLSketch') -> None:
+        """Add the stream sketched by <other> to this sketch's stream.
+
+        Precondition: other.k == self.k.
+
+        >>> first = KLLSketch()
+        >>> second = KLLSketch()
+        >>> for value in range(10):
+        ...     first.add(value)
+        ...     second.add(value + 10)
+        >>> first.merge(second)
+        >>> len(first), first.quantile(0.75)
+        (20, 14)
+        """
+        while len(self._compactors) < len(other._compactors):
+            self._grow()
+        for level, compactor in enumerate(other._compactors):
+            self._compactors[level].extend(compactor)
+        self._count += other._count
+        self._size += other._size
+        self._compress()
+
+    def quantile(self, fraction: float) -> float:
+        """Return an estimate of the least number in the stream such that
+        at least <fraction> of the stream is no greater than it.
+
+        Raise a ValueError if the stream is empty.
+
+        Precondition: 0 <= fraction <= 1.
+        """
+        if not self._count:
+            raise ValueError("quantile of an empty sketch")
+        weighted = sorted((value, 1 << level)
+                          for level, compactor in enumerate(self._compactors)
+                          for value in compactor)
+        # The rank of the quantile, counting from 1.
+        target = max(1, math.ceil(fraction * self._count))
+        rank = 0
+        for value, weight in weighted:
+            rank += weight
+            if rank >= target:
+                return value
+        return weighted[-1][0]
+
+    def quantiles(self, fractions: List[float]) -> List[float]:
+        """Return an estimate of the quantile for each of <fractions>, as
+        by quantile().
+
+        """
+        return [self.quantile(fraction) for fraction in fractions]
+
+    def _capacity(self, level: int) -> int:
+        """Return the number of numbers the compactor at <level> can hold.
+
+        """
+        depth = len(self._compactors) - level - 1
+        return int(math.ceil(self.k * self._RATIO ** depth)) + 1
+
+    def _grow(self) -> None:
+        """Add a compactor on top of the others.
+
+        """
+        self._compactors.append([])
+        self._max_size = sum(self._capacity(level)
+                             for level in range(len(self._compactors)))
+
+    def _compress(self) -> None:
+        """Compact full compactors, from the bottom up, until the numbers
+        held fit in the compactors again.
+
+        """
+        level = 0
+        while self._size >= self._max_size and level < len(self._compactors):
+            compactor = self._compactors[level]
+            if len(compactor) >= self._capacity(level):
+                if level + 1 == len(self._compactors):
+                    self._grow()
+                compactor.sort()
+                # An odd number out stays behind at this level.
+                leftover = [compactor.pop()] if len(compactor) % 2 else []
+                promoted = compactor[self._random.randrange(2)::2]
+                self._compactors[level + 1].extend(promoted)
+                self._compactors[level] = leftover
+                self._size -= len(compactor) - len(promoted)
+            level += 1
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['math', 'random',
+                                                  'typing']})
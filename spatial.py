@@ -0,0 +1,233 @@
+"""Spatial indexes for the simulation"""
+
+from bisect import insort
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from location import Location
+
+
+class GridIndex:
+    """An index of items by location, over a uniform grid of square cells.
+
+    Each item is stored under a key, in the cell that contains its location.
+    Searching for the nearest item visits the cells in rings of increasing
+    distance around the searched location, and stops as soon as no cell
+    that is left can hold an item nearer than the best one found so far.
+
+    === Attributes ===
+    cell_size: The number of rows (and columns) covered by each cell.
+    """
+
+    cell_size: int
+
+    # === Private Attributes ===
+    _cells: Dict[Tuple[int, int], Dict[Any, object]]
+    #     A dictionary whose key is the (row, column) of a cell, and value is
+    #     another dictionary. The key of the second dictionary is the key of
+    #     an item in the cell and its value is the item.
+    _where: Dict[Any, Tuple[int, int]]
+    #     The cell that holds the item with each key.
+    #
+    # === Representation Invariants ===
+    # No dictionary in _cells is empty.
+    # _where[key] == cell iff key in _cells[cell].
+
+    def __init__(self, cell_size: int) -> None:
+        """Initialize an empty GridIndex with cells of <cell_size> rows and
+        columns.
+
+        Precondition: cell_size > 0.
+        """
+        self.cell_size = cell_size
+        self._cells = {}
+        self._where = {}
+
+    def __len__(self) -> int:
+        """Return the number of items in this GridIndex.
+
+        """
+        return len(self._where)
+
+    def __iter__(self) -> Iterator[object]:
+        """Yield the items in this GridIndex, in no particular order.
+
+        """
+        for items in self._cells.values():
+            yield from items.values()
+
+    def __contains__(self, key: object) -> bool:
+        """Return True iff there is an item with <key> in this GridIndex.
+
+        """
+        return key in self._where
+
+    def add(self, key: Any, location: Location, item: object) -> None:
+        """Add <item> to this GridIndex under <key>, at <location>.
+
+        If there is already an item with <key>, it is replaced.
+
+        >>> grid = GridIndex(4)
+        >>> grid.add('a', Location(1, 1), 'A')
+        >>> grid.add('b', Location(9, 9), 'B')
+        >>> len(grid)
+        2
+        """
+        if key in self._where:
+            self.remove(key)
+        cell = (location.row // self.cell_size,
+                location.column // self.cell_size)
+        if cell not in self._cells:
+            self._cells[cell] = {}
+        self._cells[cell][key] = item
+        self._where[key] = cell
+
+    def remove(self, key: Any) -> object:
+        """Remove and return the item with <key> from this GridIndex.
+
+        Precondition: there is an item with <key> in this GridIndex.
+
+        >>> grid = GridIndex(4)
+        >>> grid.add('a', Location(1, 1), 'A')
+        >>> grid.remove('a')
+        'A'
+        >>> 'a' in grid
+        False
+        """
+        cell = self._where.pop(key)
+        items = self._cells[cell]
+        item = items.pop(key)
+        if not items:
+            del self._cells[cell]
+        return item
+
+    def nearest(self, location: Location, cost: Callable[[Any], Any],
+                bound: Callable[[int], Any]) -> Optional[object]:
+        """Return the item with the lowest <cost>, or None if this GridIndex
+        is empty.
+
+        cost: A function that returns the cost of an item. Costs must be
+            distinct, so include a tie-breaker in them if necessary.
+        bound: A function that returns a lower bound on the cost of any
+            item at least the given Manhattan distance away from <location>.
+            It must not decrease as the distance increases.
+
+        >>> grid = GridIndex(2)
+        >>> grid.add('a', Location(1, 1), Location(1, 1))
+        >>> grid.add('b', Location(4, 5), Location(4, 5))
+        >>> grid.add('c', Location(9, 0), Location(9, 0))
+        >>> here = Location(5, 5)
+        >>> def distance(loc):
+        ...     return abs(loc.row - here.row) + abs(loc.column - here.column)
+        >>> grid.nearest(here, distance, lambda d: d).row
+        4
+        """
+        best = None
+        best_cost = None
+        for distance, items in self._rings(location):
+            if best is not None and bound(distance) > best_cost:
+                break
+            for item in items:
+                item_cost = cost(item)
+                if best is None or item_cost < best_cost:
+                    best = item
+                    best_cost = item_cost
+        return best
+
+    def k_nearest(self, location: Location, k: int,
+                  cost: Callable[[Any], Any],
+                  bound: Callable[[int], Any]) -> List[object]:
+        """Return the (at most) <k> items with the lowest <cost>, from the
+        lowest cost up.
+
+        cost and bound are as for nearest().
+
+        >>> grid = GridIndex(2)
+        >>> for row in [1, 4, 9, 6]:
+        ...     grid.add(row, Location(row, 0), row)
+        >>> grid.k_nearest(Location(5, 0), 3, lambda row: abs(row - 5),
+        ...                lambda d: d)
+        [4, 6, 1]
+        """
+        best = []
+        if k <= 0:
+            return best
+        for distance, items in self._rings(location):
+            if len(best) == k and bound(distance) > best[-1][0]:
+                break
+            for item in items:
+                item_cost = cost(item)
+                if len(best) < k or item_cost < best[-1][0]:
+                    # Costs are distinct, so the items are never compared.
+                    insort(best, (item_cost, item))
+                    if len(best) > k:
+                        best.pop()
+        return [item for _, item in best]
+
+    def _rings(self, location: Location) -> Iterator[Tuple[int,
+                                                            List[object]]]:
+        """Yield the items around <location> one ring of cells at a time,
+        each with a lower bound on the Manhattan distance from <location> to
+        any location in that ring.
+
+        Ring r holds the cells that are r cells away, horizontally or
+        vertically, from the cell that contains <location>. Rings are
+        yielded in order until every item has been yielded, skipping empty
+        rings once they outnumber the occupied cells.
+
+        """
+        size = self.cell_size
+        row = location.row // size
+        column = location.column // size
+        remaining = len(self._where)
+        contents = self._cells.get((row, column))
+        items = list(contents.values()) if contents else []
+        remaining -= len(items)
+        yield 0, items
+        r = 1
+        while remaining > 0:
+            if 8 * r > len(self._cells):
+                # Visiting the occupied cells is now cheaper than visiting
+                # every cell of a ring, so group what is left by ring.
+                rings = {}
+                for (cell_row, cell_column), contents in self._cells.items():
+                    ring = max(abs(cell_row - row), abs(cell_column - column))
+                    if ring >= r:
+                        rings.setdefault(ring, []).extend(contents.values())
+                for ring in sorted(rings):
+                    yield self._ring_distance(location, ring), rings[ring]
+                return
+            items = []
+            for cell_column in range(column - r, column + r + 1):
+                for cell in ((row - r, cell_column), (row + r, cell_column)):
+                    contents = self._cells.get(cell)
+                    if contents:
+                        items.extend(contents.values())
+            for cell_row in range(row - r + 1, row + r):
+                for cell in ((cell_row, column - r), (cell_row, column + r)):
+                    contents = self._cells.get(cell)
+                    if contents:
+                        items.extend(contents.values())
+            remaining -= len(items)
+            yield self._ring_distance(location, r), items
+            r += 1
+
+    def _ring_distance(self, location: Location, r: int) -> int:
+        """Return the least Manhattan distance from <location> to a location
+        in ring <r> around the cell that contains it.
+
+        Precondition: r > 0.
+        """
+        size = self.cell_size
+        row = location.row // size
+        column = location.column // size
+        # Any location outside the block of rings 0 .. r - 1 is at least one
+        # step past the nearest edge of that block.
+        return 1 + min(location.row - (row - r + 1) * size,
+                       (row + r) * size - 1 - location.row,
+                       location.column - (column - r + 1) * size,
+                       (column + r) * size - 1 - location.column)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['bisect', 'typing',
+                                                  'location']})
@@ -0,0 +1,237 @@
+"""Travel times for the simulation
+
+Drivers ask a travel-time oracle how long it takes to travel between two
+locations. The oracle that all drivers share is Driver.oracle, which is a
+ManhattanOracle unless it is replaced, for example by a CachedOracle that
+memoizes a more expensive oracle.
+
+Oracles must never give a time shorter than the Manhattan distance would,
+since dispatchers use the Manhattan distance to bound their searches for
+the nearest driver.
+"""
+
+from collections import OrderedDict
+from typing import Iterable, Sequence, Tuple
+from location import Location, intern_location, manhattan_distance, \
+    manhattan_distances
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class TravelOracle:
+    """An oracle for the times it takes to travel between locations.
+
+    This is an abstract class. Only subclasses should be instantiated.
+    """
+
+    def travel_time(self, origin: Location, destination: Location,
+                    speed: int) -> int:
+        """Return the time it takes to travel from <origin> to
+        <destination> at <speed>, rounded to the nearest integer.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def travel_times(self, rows: Sequence[int], columns: Sequence[int],
+                     speeds: Sequence[int], to_rows: Sequence[int],
+                     to_columns: Sequence[int]) -> object:
+        """Return the times it takes to travel from each of N locations, at
+        <rows> and <columns> with <speeds>, to each of M locations, at
+        <to_rows> and <to_columns>, as an N by M matrix.
+
+        The matrix is a numpy array of ints if numpy is installed, and a
+        list of N lists otherwise. Subclasses that can compute many times at
+        once should override this; by default, each time is asked of
+        travel_time().
+        """
+        destinations = [intern_location(row, column)
+                        for row, column in zip(to_rows, to_columns)]
+        times = [[self.travel_time(intern_location(row, column),
+                                   destination, speed)
+                  for destination in destinations]
+                 for row, column, speed in zip(rows, columns, speeds)]
+        if numpy is None:
+            return times
+        return numpy.array(times, dtype=numpy.int64).reshape(
+            len(times), len(destinations))
+
+
+class ManhattanOracle(TravelOracle):
+    """An oracle for travel along the rows and columns of the grid, which
+    takes the Manhattan distance divided by the speed.
+
+    >>> ManhattanOracle().travel_time(Location(1, 1), Location(4, 3), 2)
+    2
+    """
+
+    def travel_time(self, origin: Location, destination: Location,
+                    speed: int) -> int:
+        """Return the time it takes to travel from <origin> to
+        <destination> at <speed>, rounded to the nearest integer.
+
+        """
+        return round(manhattan_distance(origin, destination) / speed)
+
+    def travel_times(self, rows: Sequence[int], columns: Sequence[int],
+                     speeds: Sequence[int], to_rows: Sequence[int],
+                     to_columns: Sequence[int]) -> object:
+        """Return the times it takes to travel from each of N locations to
+        each of M locations, as an N by M matrix, where the arguments and
+        matrix are as for TravelOracle.travel_times.
+
+        The times are computed in one vectorized operation if numpy is
+        installed, and rounded as by travel_time(): numpy rounds halves to
+        even, as round() does.
+
+        >>> oracle = ManhattanOracle()
+        >>> times = oracle.travel_times([0, 0], [0, 0], [1, 2], [1, 5], [2, 0])
+        >>> [[int(time) for time in row] for row in times]
+        [[3, 5], [2, 2]]
+        """
+        distances = manhattan_distances(rows, columns, to_rows, to_columns)
+        return divide_rounded(distances, speeds)
+
+
+class CachedOracle(TravelOracle):
+    """An oracle that remembers the times given by another oracle, for the
+    most recently used combinations of origin, destination and speed.
+
+    >>> oracle = CachedOracle(ManhattanOracle(), 2)
+    >>> here, there = Location(1, 1), Location(4, 3)
+    >>> oracle.travel_time(here, there, 1), oracle.travel_time(here, there, 1)
+    (5, 5)
+    >>> oracle.hits, oracle.misses
+    (1, 1)
+
+    === Attributes ===
+    oracle: The oracle whose times are remembered.
+    max_size: The largest number of times remembered.
+    hits: The number of times that were asked for and remembered.
+    misses: The number of times that were asked for and not remembered.
+    """
+
+    oracle: TravelOracle
+    max_size: int
+    hits: int
+    misses: int
+
+    # === Private Attributes ===
+    _times: OrderedDict
+    #     A dictionary whose key is a tuple (origin, destination, speed), and
+    #     value is the time the oracle gave for it, from the least recently
+    #     used up.
+    #
+    # === Representation Invariants ===
+    # len(_times) <= max_size
+
+    def __init__(self, oracle: TravelOracle, max_size: int = 1 << 16) -> None:
+        """Initialize a CachedOracle that remembers up to <max_size> times
+        given by <oracle>.
+
+        Precondition: max_size > 0.
+        """
+        self.oracle = oracle
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._times = OrderedDict()
+
+    def __len__(self) -> int:
+        """Return the number of times remembered.
+
+        """
+        return len(self._times)
+
+    def travel_time(self, origin: Location, destination: Location,
+                    speed: int) -> int:
+        """Return the time it takes to travel from <origin> to
+        <destination> at <speed>, as given by the oracle.
+
+        """
+        key = (origin, destination, speed)
+        time = self._times.get(key)
+        if time is not None:
+            self.hits += 1
+            self._times.move_to_end(key)
+            return time
+        self.misses += 1
+        time = self.oracle.travel_time(origin, destination, speed)
+        self._remember(key, time)
+        return time
+
+    def travel_times(self, rows: Sequence[int], columns: Sequence[int],
+                     speeds: Sequence[int], to_rows: Sequence[int],
+                     to_columns: Sequence[int]) -> object:
+        """Return the times it takes to travel from each of N locations to
+        each of M locations, as given by the oracle.
+
+        Matrices of times are neither remembered nor counted, since the
+        oracle computes them together.
+        """
+        return self.oracle.travel_times(rows, columns, speeds, to_rows,
+                                        to_columns)
+
+    def warm(self, trips: Iterable[Tuple[Location, Location, int]]) -> None:
+        """Remember the time for each (origin, destination, speed) trip in
+        <trips>, without counting hits or misses.
+
+        >>> oracle = CachedOracle(ManhattanOracle())
+        >>> oracle.warm([(Location(1, 1), Location(4, 3), 1)])
+        >>> oracle.travel_time(Location(1, 1), Location(4, 3), 1)
+        5
+        >>> oracle.hits, oracle.misses
+        (1, 0)
+        """
+        for origin, destination, speed in trips:
+            key = (origin, destination, speed)
+            if key in self._times:
+                self._times.move_to_end(key)
+            else:
+                self._remember(key, self.oracle.travel_time(
+                    origin, destination, speed))
+
+    def clear(self) -> None:
+        """Forget every time remembered, and reset the counters.
+
+        """
+        self._times.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, key: Tuple[Location, Location, int],
+                  time: int) -> None:
+        """Remember <time> for <key>, forgetting the least recently used
+        time if there are too many.
+
+        """
+        self._times[key] = time
+        if len(self._times) > self.max_size:
+            self._times.popitem(last=False)
+
+
+def divide_rounded(matrix: object, speeds: Sequence[int]) -> object:
+    """Return the matrix with each row of <matrix> divided by the speed for
+    that row, and rounded to the nearest integer, as round() does.
+
+    <matrix> is a numpy array if numpy is installed, and a list of lists
+    otherwise, and so is the matrix returned.
+
+    >>> [[int(time) for time in row]
+    ...  for row in divide_rounded(manhattan_distances([0], [0], [5], [0]),
+    ...                            [2])]
+    [[2]]
+    """
+    if numpy is None:
+        return [[round(value / speed) for value in row]
+                for row, speed in zip(matrix, speeds)]
+    speeds = numpy.asarray(speeds, dtype=numpy.int64)[:, None]
+    return numpy.rint(matrix / speeds).astype(numpy.int64)
+
+
+if __name__ == '__main__':
+    import python_ta
+    python_ta.check_all(config={'extra-imports': ['collections', 'typing',
+                                                  'location', 'numpy']})